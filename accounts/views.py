@@ -6,10 +6,13 @@ from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.views.generic import CreateView
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Concat
+from django.contrib.contenttypes.models import ContentType
 from . import forms
 from .models import TempPassword
-from photoapp.models import Photo
+from photoapp.models import Photo, Favorite, TaggedPeople
+from photoapp.cache_utils import MEMBER_COUNTS_KEY, get_or_compute
 from django.template.defaulttags import register
 import secrets
 import string
@@ -41,25 +44,32 @@ def get_value(dictionary, key):
     return dictionary.get(key)
 
 
+def _member_counts():
+    photo_type = ContentType.objects.get_for_model(Photo)
+
+    def count_of(qs, fk):
+        return Coalesce(Subquery(qs.order_by().values(fk).annotate(n=Count('id')).values('n')), 0)
+
+    members = (get_user_model().objects
+               .order_by('first_name')
+               .annotate(
+                   upload_count=count_of(Photo.objects.filter(submitter=OuterRef('pk')), 'submitter'),
+                   favorite_count=count_of(Favorite.objects.filter(user=OuterRef('pk')), 'user'),
+                   people_count=count_of(
+                       TaggedPeople.objects.filter(
+                           content_type=photo_type,
+                           tag__name=Concat(OuterRef('first_name'), Value(' '), OuterRef('last_name')),
+                       ), 'tag'),
+               )
+               .values('id', 'first_name', 'last_name', 'upload_count', 'favorite_count', 'people_count'))
+    return list(members)
+
+
 @login_required
 def member_list_view(request):
-    members = get_user_model().objects.order_by('first_name')
-    member_photos = {}
-    favorites = {}
-    people = {}
-    for member in members:
-        x = member.id
-        fav_lookups = Q(favorite__user__id__exact=member.id)
-        lookups = Q(submitter_id__exact=member.id)
-        people_lookups =Q(people__name__exact=f'{member.first_name} {member.last_name}')
-        count = Photo.objects.filter(lookups)
-        fav_count = Photo.objects.filter(fav_lookups)
-        people_count = Photo.objects.filter(people_lookups)
-        member_photos[x] = len(count)
-        favorites[x] = len(fav_count)
-        people[x] = len(people_count)
-
-    context = {'members':members, 'member_photos':member_photos, 'favorites':favorites, 'people':people,}
+    members = get_or_compute(MEMBER_COUNTS_KEY, _member_counts, 3600)  # invalidated by photoapp.signals
+
+    context = {'members': members}
 
     return render(request, 'accounts/member_list.html', context)
 
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from import_export.admin import ImportExportModelAdmin
 from import_export import resources
-from .models import Photo, Year, GenericTag, PeopleTag, Comment, Favorite
+from .models import Photo, Year, GenericTag, PeopleTag, Comment, Favorite, DerivativeJob
 
 class PhotoResource(resources.ModelResource):
 
@@ -41,3 +41,4 @@ admin.site.register(GenericTag, GenericTagIEAdmin)
 admin.site.register(PeopleTag, PeopleTagIEAdmin)
 admin.site.register(Comment)
 admin.site.register(Favorite)
+admin.site.register(DerivativeJob)
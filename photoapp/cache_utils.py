@@ -1,20 +1,115 @@
 # photoapp/cache_utils.py
+import time
+
 from django.core.cache import cache
+from django.db.models import F
+
+from .models import CacheVersion
+
+COUNT_VER_KEY = 'count_ver_v1'  # part of every cached per-filter photo count key
+
+# One scope per photo grid filter (search_m), 'all' being the unfiltered
+# grid. Counts are versioned per scope so a change only retires the
+# filters it can actually affect.
+LIST_SCOPES = ('all', 'favorites', 'member', 'tag', 'year', 'person', 'search')
+
+def list_scope(search_m) -> str:
+    return search_m or 'all'
+
+def _get_ver(key) -> int:
+    # A row that was never bumped reads as version 1.
+    return CacheVersion.objects.filter(key=key).values_list('value', flat=True).first() or 1
+
+def _bump_ver(key):
+    # Atomic on every backend, unlike cache.incr() on the file/db caches.
+    CacheVersion.objects.get_or_create(key=key)
+    CacheVersion.objects.filter(key=key).update(value=F('value') + 1)
+
+def get_count_ver(scope='all') -> int:
+    return _get_ver(f'{COUNT_VER_KEY}:{scope}')
+
+def bump_count_ver(*scopes):
+    """Retire cached photo counts of `scopes` (all scopes if none given)."""
+    for scope in scopes or LIST_SCOPES:
+        _bump_ver(f'{COUNT_VER_KEY}:{scope}')
+
+
+SIMILAR_VER_KEY = 'similar_ver_v1'  # the dhash index each process holds (photoapp.similar)
+
+def get_similar_ver() -> int:
+    return _get_ver(SIMILAR_VER_KEY)
+
+def bump_similar_ver():
+    _bump_ver(SIMILAR_VER_KEY)
+
+
+MEMBER_COUNTS_KEY = 'member_counts_v2'
+
+def invalidate_member_counts():
+    cache.delete(MEMBER_COUNTS_KEY)
+
+
+CACHE_KEY_FACETS = 'facet_counts_v3'
+FACET_KINDS = ('tag', 'people', 'year')
+
+def facet_key(kind) -> str:
+    return f'{CACHE_KEY_FACETS}:{kind}'
+
+def invalidate_facet_cache(*kinds):
+    """Drop the cached dropdown counts of `kinds` (all of them if none given)."""
+    cache.delete_many([facet_key(kind) for kind in kinds or FACET_KINDS])
+
+
+# --- stampede protection for expensive cached values
+
+LOCK_TTL = 30        # seconds a recompute may hold the lock
+LOCK_WAIT = 2.0      # how long a cold-miss reader waits for the lock holder
+LOCK_POLL = 0.05
+
+def _recompute(key, compute, ttl, early):
+    value = compute()
+    # Stored with the time it should be refreshed, `early` seconds before it expires.
+    cache.set(key, (value, time.time() + ttl - early), ttl)
+    return value
+
+def get_or_compute(key, compute, ttl, early=None):
+    """
+    cache.get_or_set() for values that are expensive to compute, without
+    the stampede when they expire:
+
+    * Past the refresh time (`early` seconds before expiry, default 10% of
+      `ttl`) the first reader takes a short lock (cache.add) and recomputes;
+      everyone else keeps getting the current value meanwhile.
+    * On a cold miss (e.g. just invalidated) one reader computes and the
+      rest wait up to LOCK_WAIT for it, then compute themselves rather
+      than hang if the lock holder died.
+
+    The lock is as good as the backend's add(): an INSERT on the db cache,
+    atomic on Redis/Memcached, but check-then-write on the file cache, where
+    it only narrows the stampede.
+    """
+    early = ttl // 10 if early is None else early
+    lock_key = f'{key}:lock'
+    entry = cache.get(key)
+    if entry is not None:
+        value, refresh_at = entry
+        if time.time() < refresh_at or not cache.add(lock_key, 1, LOCK_TTL):
+            return value
+        try:
+            return _recompute(key, compute, ttl, early)
+        finally:
+            cache.delete(lock_key)
+
+    if cache.add(lock_key, 1, LOCK_TTL):
+        try:
+            return _recompute(key, compute, ttl, early)
+        finally:
+            cache.delete(lock_key)
 
-GRID_VER_KEY = 'grid_ver_v1'  # bump suffix if you ever want to invalidate everything
-
-def get_grid_ver() -> int:
-    v = cache.get(GRID_VER_KEY)
-    if v is None:
-        v = 1
-        cache.set(GRID_VER_KEY, v, None)  # no expiry; fragments have their own TTL
-    return v
-
-def bump_grid_ver() -> int:
-    # Works with Redis/Memcached incr; falls back for LocMem
-    try:
-        return cache.incr(GRID_VER_KEY)
-    except Exception:
-        v = get_grid_ver() + 1
-        cache.set(GRID_VER_KEY, v, None)
-        return v
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+    return compute()
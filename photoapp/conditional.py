@@ -0,0 +1,39 @@
+# photoapp/conditional.py
+"""
+Validators for the photo views. ETags are hashed from state the app
+already keeps current (Photo.version, the per-scope count versions, the
+cached facet counts), so a revalidation is answered with a 304 before
+any tile or template is rendered.
+"""
+import hashlib
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def member_state(request):
+    """What a page shows of the member viewing it: who, their rights, and the CSRF secret in its forms."""
+    user = request.user
+    return (user.pk, user.first_name, user.last_name, user.is_editor, user.is_staff,
+            request.COOKIES.get(settings.CSRF_COOKIE_NAME))
+
+
+def not_modified(request, etag):
+    """A 304 when a GET's If-None-Match matches `etag`, else None."""
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    return get_conditional_response(request, etag=etag)
+
+
+def add_validators(response, etag, vary=()):
+    response['ETag'] = etag
+    # Per member and always revalidated; a matching ETag makes that a 304.
+    patch_cache_control(response, private=True, no_cache=True)
+    if vary:
+        patch_vary_headers(response, vary)
+    return response
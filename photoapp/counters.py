@@ -0,0 +1,87 @@
+# photoapp/counters.py
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Photo, Comment, Favorite, Year, GenericTag, PeopleTag, TaggedGeneric, TaggedPeople
+
+# Facet models and the through table (None: Photo.year) their photo_count counts.
+FACET_MODELS = (
+    (GenericTag, TaggedGeneric),
+    (PeopleTag, TaggedPeople),
+    (Year, None),
+)
+
+
+def bump_photo_counter(photo_id, field, delta):
+    """
+    Atomically add `delta` to one of Photo's denormalized counters. The
+    tile shows the counters, so its version moves in the same UPDATE.
+    """
+    Photo.objects.filter(pk=photo_id).update(**{field: Greatest(F(field) + delta, Value(0))},
+                                             version=F('version') + 1)
+
+
+def bump_facet_counter(model, pks, delta):
+    """Atomically add `delta` to photo_count of the Year/GenericTag/PeopleTag rows in `pks`."""
+    if pks:
+        model.objects.filter(pk__in=pks).update(photo_count=Greatest(F('photo_count') + delta, Value(0)))
+
+
+def _count_subquery(model, fk, **filters):
+    return Coalesce(Subquery(
+        model.objects
+        .filter(**{fk: OuterRef('pk')}, **filters)
+        .order_by()
+        .values(fk)
+        .annotate(n=Count('id'))
+        .values('n')
+    ), 0)
+
+
+def reconcile_photo_counters():
+    """
+    Recompute comments_count/favorites_count; returns the number of rows
+    fixed. Their version moves too, as with bump_photo_counter, so cached
+    tiles stop showing the drifted counts.
+    """
+    actual_comments = _count_subquery(Comment, 'photo')
+    actual_favorites = _count_subquery(Favorite, 'favorite')
+    drifted = (Photo.objects
+               .annotate(actual_comments=actual_comments, actual_favorites=actual_favorites)
+               .exclude(comments_count=F('actual_comments'), favorites_count=F('actual_favorites')))
+    return (Photo.objects
+            .filter(pk__in=drifted.values('pk'))
+            .update(comments_count=actual_comments, favorites_count=actual_favorites,
+                    version=F('version') + 1))
+
+
+def reconcile_facet_counters():
+    """Recompute photo_count on years, tags and people; returns the number of rows fixed."""
+    photo_type = ContentType.objects.get_for_model(Photo)
+    fixed = 0
+    for model, through in FACET_MODELS:
+        if through is None:
+            actual = _count_subquery(Photo, 'year')
+        else:
+            actual = _count_subquery(through, 'tag', content_type=photo_type)
+        drifted = model.objects.annotate(actual=actual).exclude(photo_count=F('actual'))
+        fixed += model.objects.filter(pk__in=drifted.values('pk')).update(photo_count=actual)
+    return fixed
+
+
+# facet kind -> (model, label field, dropdown order)
+FACETS = {
+    'tag': (GenericTag, 'name', 'name'),
+    'people': (PeopleTag, 'name', 'name'),
+    'year': (Year, 'year', '-year'),
+}
+
+
+def facet_counts(kinds=tuple(FACETS)):
+    """{kind: {name: photo count}} for the list dropdowns, read from the counters."""
+    data = {}
+    for kind in kinds:
+        model, field, order = FACETS[kind]
+        data[kind] = dict(model.objects.filter(photo_count__gt=0).order_by(order).values_list(field, 'photo_count'))
+    return data
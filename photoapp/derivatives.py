@@ -0,0 +1,121 @@
+# photoapp/derivatives.py
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import invalidation
+from .models import Photo, PhotoDerivative, DerivativeJob
+
+
+def claim_next_job():
+    """Lock and return the oldest pending job, or None if the queue is empty."""
+    with transaction.atomic():
+        job = (DerivativeJob.objects
+               .select_for_update(skip_locked=True)
+               .filter(status=DerivativeJob.PENDING)
+               .order_by('created', 'id')
+               .first())
+        if job is None:
+            return None
+        job.status = DerivativeJob.RUNNING
+        job.attempts += 1
+        job.save(update_fields=['status', 'attempts', 'updated'])
+    return job
+
+
+def _finish(job, status, error=''):
+    # An UPDATE rather than job.save(update_fields=...): deleting the photo while
+    # the job runs cascades to its row, and then there is nothing to update.
+    job.status, job.error = status, error
+    DerivativeJob.objects.filter(pk=job.pk).update(status=status, error=error, updated=timezone.now())
+
+
+def run_job(job):
+    max_attempts = settings.PHOTO_DERIVATIVE_MAX_ATTEMPTS
+    try:
+        photo = Photo.objects.get(pk=job.photo_id)
+    except Photo.DoesNotExist:
+        _finish(job, DerivativeJob.DONE)  # deleted since it was queued: nothing to build
+        return True
+    try:
+        photo.build_derivatives()
+    except Exception:
+        if not Photo.objects.filter(pk=job.photo_id).exists():
+            _finish(job, DerivativeJob.DONE)  # deleted while it was being built
+            return True
+        _finish(job, DerivativeJob.FAILED if job.attempts >= max_attempts else DerivativeJob.PENDING,
+                traceback.format_exc())
+        return False
+
+    _finish(job, DerivativeJob.DONE)
+    return True
+
+
+def requeue_stale_jobs(older_than):
+    """Put jobs left RUNNING by a crashed worker back on the queue."""
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    return (DerivativeJob.objects
+            .filter(status=DerivativeJob.RUNNING, updated__lt=cutoff)
+            .update(status=DerivativeJob.PENDING))
+
+
+# --- bulk rebuilds (manage.py rebuild_thumbnails, import_photos)
+
+def upload_dirs():
+    """The strftime upload_to of the original and derivative fields, for worker processes."""
+    return {'image': Photo._meta.get_field('image').upload_to,
+            'derivative': PhotoDerivative._meta.get_field('image').upload_to}
+
+
+def stored_derivative_files(photo_ids):
+    """{photo id: set of stored derivative names}, the legacy thumbnail included."""
+    files = {pk: set() for pk in photo_ids}
+    for photo_id, name in PhotoDerivative.objects.filter(photo_id__in=photo_ids).values_list('photo_id', 'image'):
+        files[photo_id].add(name)
+    for photo_id, name in Photo.objects.filter(pk__in=photo_ids).exclude(thumbnail='').values_list('id', 'thumbnail'):
+        files[photo_id].add(name)
+    return files
+
+
+def stored_bytes(names):
+    return sum(default_storage.size(name) for name in names if default_storage.exists(name))
+
+
+def replace_derivatives(rendered):
+    """
+    Swap in derivatives rendered by workers, {photo id: rebuild_file
+    result} ('derivatives' smallest first, 'dhash' and 'metadata'), in one
+    transaction: old rows out, new rows bulk-created, photos bulk-updated
+    (version bumped so cached tiles and details re-render). Returns the
+    file names no longer referenced, to delete once committed.
+    """
+    with transaction.atomic():
+        photos = Photo.objects.select_for_update().only('id', 'thumbnail').in_bulk(list(rendered))
+        old_files = set().union(*stored_derivative_files(list(photos)).values())
+        PhotoDerivative.objects.filter(photo_id__in=list(photos)).delete()
+        PhotoDerivative.objects.bulk_create([
+            PhotoDerivative(photo_id=pk, size=size, format=format_type, image=name, width=width, height=height)
+            for pk in photos
+            for size, format_type, name, width, height in rendered[pk]['derivatives']
+        ])
+        for pk, photo in photos.items():
+            photo.thumbnail.name = rendered[pk]['derivatives'][0][2]
+            photo.derivatives_ready = True
+            photo.dhash = rendered[pk]['dhash']
+            photo.set_metadata(rendered[pk]['metadata'])
+            photo.version = F('version') + 1
+        Photo.objects.bulk_update(list(photos.values()),
+                                  ['thumbnail', 'derivatives_ready', 'dhash', *Photo.METADATA_FIELDS, 'version'])
+        # Nothing left for the queue to do for these.
+        (DerivativeJob.objects.filter(photo_id__in=list(photos), status=DerivativeJob.PENDING)
+         .update(status=DerivativeJob.DONE))
+
+    # Photos deleted meanwhile leave their new files behind as well.
+    orphaned = {d[2] for pk, result in rendered.items() if pk not in photos for d in result['derivatives']}
+    invalidation.fingerprints_changed()
+    return old_files | orphaned
@@ -0,0 +1,137 @@
+# photoapp/detail.py
+"""
+The photo detail payload shared by photo_detail_view, delete_comment,
+edit_comment and the batch prefetch. The fragments of detail_modal.html
+that look the same to every member (header and image, uploader,
+favorites, tags and people) are rendered once per Photo.version and
+cached; comments, the per-member controls and the similar photos (which
+move with other photos' hashes) are rendered per request.
+"""
+from django.core.cache import cache
+from django.db.models import Prefetch, prefetch_related_objects
+from django.shortcuts import get_object_or_404
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .conditional import make_etag, member_state
+from .models import Photo, Comment, Favorite
+from .similar import similar_ids, similar_photos
+
+DETAIL_TTL = 60 * 60 * 24  # keys carry the version, like the grid tiles
+DETAIL_PARTS = ('head', 'about', 'favorites', 'tags')
+
+
+def detail_key(photo_id, version):
+    return f'photo_detail_v1:{photo_id}:{version}'
+
+
+def _detail_queryset():
+    # The rows every detail render reads.
+    return Photo.objects.select_related('submitter', 'edited_by', 'year')
+
+
+def detail_photo(pk):
+    return get_object_or_404(_detail_queryset(), pk=pk)
+
+
+def detail_photos(pks):
+    """The photos in `pks` that still exist, in `pks` order."""
+    photos = _detail_queryset().in_bulk(pks)
+    return [photos[pk] for pk in pks if pk in photos]
+
+
+def detail_etag(request, photo, ajax=True):
+    """
+    Changes whenever the detail would: comments, favorites, edits and
+    renames all move Photo.version (photoapp.invalidation); the similar
+    panel is keyed by the ids it lists.
+    """
+    return make_etag('detail', ajax, photo.pk, photo.version, photo.comments_count, photo.favorites_count,
+                     similar_ids(photo), member_state(request))
+
+
+def _prefetch(photos, *lookups):
+    prefetch_related_objects(
+        photos, 'tags', 'people', 'derivatives',
+        Prefetch('favorite', queryset=Favorite.objects.select_related('user').order_by('id')),
+        *lookups,
+    )
+
+
+def photo_parts(photos):
+    """
+    {photo id: {part: HTML}} of the shared detail fragments. One
+    cache.get_many; the photos missing from it are prefetched together
+    and rendered.
+    """
+    keys = {p.pk: detail_key(p.pk, p.version) for p in photos}
+    found = cache.get_many(keys.values())
+    missing = [p for p in photos if keys[p.pk] not in found]
+    if missing:
+        _prefetch(missing)
+        fresh = {}
+        for photo in missing:
+            context = {'photo': photo, 'favorites': photo.favorite.all()}
+            fresh[keys[photo.pk]] = {name: render_to_string(f'photoapp/detail_{name}.html', context)
+                                     for name in DETAIL_PARTS}
+        cache.set_many(fresh, DETAIL_TTL)
+        found.update(fresh)
+    return {pk: {name: mark_safe(html) for name, html in found[key].items()} for pk, key in keys.items()}
+
+
+def _payload(request, photo, parts, is_favorite, comments, similar):
+    html = render_to_string('photoapp/detail_modal.html', {
+        'photo': photo,
+        'parts': parts,
+        'is_favorite': is_favorite,
+        'comments': comments,
+        'similar': similar,
+        'user': request.user,
+    }, request=request)
+    return {
+        'html': html,
+        'photo_id': photo.id,
+        'is_favorite': is_favorite,
+        'favorites_count': photo.favorites_count,
+        'comments_count': photo.comments_count,
+        'etag': detail_etag(request, photo),
+    }
+
+
+def detail_payload(request, photo, is_favorite=None):
+    """The JSON body of an AJAX detail response: the modal HTML plus the counts the grid shows."""
+    if is_favorite is None:
+        is_favorite = Favorite.objects.filter(user=request.user, favorite=photo).exists()
+    comments = list(photo.comments.select_related('submitter'))
+    return _payload(request, photo, photo_parts([photo])[photo.pk], is_favorite, comments,
+                    similar_photos([photo])[photo.pk])
+
+
+def detail_payloads(request, photos):
+    """{photo id: detail_payload} for `photos`, with one query each for favorites and comments."""
+    ids = [p.pk for p in photos]
+    favorite_ids = set(Favorite.objects.filter(user=request.user, favorite_id__in=ids)
+                       .values_list('favorite_id', flat=True))
+    comments = {}
+    for comment in Comment.objects.filter(photo_id__in=ids).select_related('submitter'):
+        comments.setdefault(comment.photo_id, []).append(comment)
+    parts = photo_parts(photos)
+    similar = similar_photos(photos)
+    return {p.pk: _payload(request, p, parts[p.pk], p.pk in favorite_ids, comments.get(p.pk, []), similar[p.pk])
+            for p in photos}
+
+
+def detail_context(photo, user, is_favorite=None):
+    """Context for the full-page photoapp/detail.html."""
+    _prefetch([photo], Prefetch('comments', queryset=Comment.objects.select_related('submitter')))
+    favorites = photo.favorite.all()
+    if is_favorite is None:
+        is_favorite = any(f.user_id == user.pk for f in favorites)
+    return {
+        'photo': photo,
+        'is_favorite': is_favorite,
+        'favorites': favorites,
+        'favorites_count': photo.favorites_count,
+        'comments': photo.comments.all(),
+        'similar': similar_photos([photo])[photo.pk],
+    }
@@ -0,0 +1,298 @@
+# photoapp/image_utils.py
+import math
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files import File
+from PIL import Image, ExifTags, features
+
+# Thumbnail/derivative format follows the original's extension.
+FORMATS_BY_EXTENSION = {
+    'jpg': ('jpg', 'JPEG'),
+    'jpeg': ('jpg', 'JPEG'),
+    'png': ('png', 'PNG'),
+    'webp': ('webp', 'WEBP'),
+}
+DEFAULT_FORMAT = ('jpg', 'JPEG')
+
+# Modern formats rendered next to the fallback, best first.
+MODERN_FORMATS = {
+    'AVIF': 'avif',
+    'WEBP': 'webp',
+}
+
+# Encoder settings per format, tuned for photos viewed on screen rather
+# than archival copies (the original is always kept).
+ENCODER_OPTIONS = {
+    'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': 80, 'method': 4},
+    'AVIF': {'quality': 60, 'speed': 8},
+}
+
+
+def output_format(name):
+    """Return (file_extension, PIL format) for derivatives of `name`."""
+    ext = os.path.splitext(name)[1].lstrip('.').lower()
+    return FORMATS_BY_EXTENSION.get(ext, DEFAULT_FORMAT)
+
+
+# Resize modes: (JPEG draft headroom over the largest size, reducing_gap).
+# `draft` lets libjpeg decode at 1/2, 1/4 or 1/8 scale straight from the
+# DCT coefficients; `reducing_gap` box-reduces before the final LANCZOS pass.
+# 'quality' keeps a little headroom, still under the 1/2 scale of a 24 MP
+# (6000x4000) JPEG for 2048 derivatives; 2x headroom forced a full decode.
+RESIZE_MODES = {
+    'quality': (1.25, 3.0),
+    'speed': (1, 2.0),
+}
+
+
+def supported_modern_formats(wanted):
+    """PIL format names from `wanted` (e.g. ['avif', 'webp']) this Pillow can encode."""
+    wanted = {w.upper() for w in wanted}
+    return [f for f in MODERN_FORMATS if f in wanted and features.check(f.lower())]
+
+
+# EXIF orientation -> the transpose that shows the picture upright
+# (the table ImageOps.exif_transpose uses; 2, 4, 5 and 7 are mirrored).
+ORIENTATIONS = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+# Orientations whose transpose turns the picture a quarter, swapping width and height.
+TRANSPOSED = {orientation for orientation, method in ORIENTATIONS.items()
+              if method in (Image.Transpose.TRANSPOSE, Image.Transpose.TRANSVERSE,
+                            Image.Transpose.ROTATE_90, Image.Transpose.ROTATE_270)}
+
+
+def decode_oriented(img, draft_size=None):
+    """
+    Apply the EXIF orientation of an opened image. With `draft_size`, JPEGs
+    are decoded at the smallest DCT scale that still covers that long edge.
+    """
+    orientation = img.getexif().get(ExifTags.Base.Orientation)
+    if draft_size and img.format == 'JPEG':
+        # An aspect-correct box: a square one lets the short edge pick the scale.
+        img.draft(None, fit_within(*img.size, draft_size))
+    if orientation in ORIENTATIONS:
+        img = img.transpose(ORIENTATIONS[orientation])
+    return img
+
+
+def open_oriented(fp, draft_size=None):
+    """Open an image and apply its EXIF orientation (see decode_oriented)."""
+    return decode_oriented(Image.open(fp), draft_size)
+
+
+def _exif_text(value):
+    if isinstance(value, bytes):
+        value = value.decode(errors='ignore')
+    return str(value).strip('\x00 ') if value is not None else ''
+
+
+def _exif_datetime(value, offset=None):
+    """'YYYY:MM:DD HH:MM:SS' as a datetime, aware if an OffsetTime ('+HH:MM') came with it."""
+    try:
+        taken = datetime.strptime(_exif_text(value)[:19], '%Y:%m:%d %H:%M:%S')
+    except ValueError:
+        return None  # missing, or the all-blank/zero dates some cameras write
+    if offset:
+        try:
+            taken = taken.replace(tzinfo=datetime.strptime(_exif_text(offset), '%z').tzinfo)
+        except ValueError:
+            pass
+    return taken
+
+
+def _gps_degrees(dms, ref, limit):
+    try:
+        degrees = float(dms[0]) + float(dms[1]) / 60 + float(dms[2]) / 3600
+    except (TypeError, ValueError, IndexError, ZeroDivisionError):
+        return None
+    if not math.isfinite(degrees) or degrees > limit:
+        return None
+    return -degrees if _exif_text(ref).upper() in ('S', 'W') else degrees
+
+
+def read_metadata(img):
+    """
+    What the original's EXIF says, from an opened image (before drafting,
+    which shrinks img.size): {'taken': capture datetime or None, 'camera':
+    make and model or '', 'width', 'height': as displayed, 'latitude',
+    'longitude': degrees or None}.
+    """
+    exif = img.getexif()
+    details = exif.get_ifd(ExifTags.IFD.Exif)
+    gps = exif.get_ifd(ExifTags.IFD.GPSInfo)
+
+    width, height = img.size
+    if exif.get(ExifTags.Base.Orientation) in TRANSPOSED:
+        width, height = height, width
+
+    make = _exif_text(exif.get(ExifTags.Base.Make))
+    model = _exif_text(exif.get(ExifTags.Base.Model))
+    # Most models repeat the make ("Canon" / "Canon EOS 5D").
+    camera = model if model.lower().startswith(make.lower()) else f'{make} {model}'.strip()
+
+    taken = (_exif_datetime(details.get(ExifTags.Base.DateTimeOriginal),
+                            details.get(ExifTags.Base.OffsetTimeOriginal))
+             or _exif_datetime(details.get(ExifTags.Base.DateTimeDigitized),
+                               details.get(ExifTags.Base.OffsetTimeDigitized)))
+
+    latitude = longitude = None
+    if ExifTags.GPS.GPSLatitude in gps and ExifTags.GPS.GPSLongitude in gps:
+        latitude = _gps_degrees(gps[ExifTags.GPS.GPSLatitude], gps.get(ExifTags.GPS.GPSLatitudeRef), 90)
+        longitude = _gps_degrees(gps[ExifTags.GPS.GPSLongitude], gps.get(ExifTags.GPS.GPSLongitudeRef), 180)
+        if latitude is None or longitude is None:
+            latitude = longitude = None
+
+    return {'taken': taken, 'camera': camera[:64], 'width': width, 'height': height,
+            'latitude': latitude, 'longitude': longitude}
+
+
+def fit_within(width, height, size):
+    """Dimensions of (width, height) scaled so the long edge is `size`."""
+    scale = size / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def resize_steps(img, sizes, reducing_gap=None):
+    """
+    Yield (size, image) for each long-edge size, largest first, each step
+    resized from the previous one so the original is only decoded once.
+    Sizes at or above the original's long edge collapse into a single
+    full-resolution step (we never upscale).
+    """
+    current = img
+    full_size_done = False
+    for size in sorted(sizes, reverse=True):
+        if size >= max(img.size):
+            if not full_size_done:
+                full_size_done = True
+                yield size, img
+            continue
+        current = current.resize(fit_within(*img.size, size), Image.LANCZOS,  # LANCZOS for better quality
+                                 reducing_gap=reducing_gap)
+        yield size, current
+
+
+def encode(img, format_type):
+    if format_type == 'JPEG':
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+    elif format_type in ('AVIF', 'WEBP') and img.mode not in ('RGB', 'RGBA'):
+        # Unlike JPEG these keep an alpha channel, so only drop it when there is none.
+        img = img.convert('RGBA' if img.has_transparency_data else 'RGB')
+    output = BytesIO()
+    img.save(output, format=format_type, **ENCODER_OPTIONS.get(format_type, {}))
+    output.seek(0)
+    return output
+
+
+# Difference hash: one bit per horizontally adjacent pixel pair of a
+# (DHASH_SIZE + 1) x DHASH_SIZE greyscale shrink, 64 bits in all.
+DHASH_SIZE = 8
+DHASH_MASK = (1 << DHASH_SIZE * DHASH_SIZE) - 1
+
+
+def dhash(img):
+    """
+    64-bit difference hash of `img`, as a signed int so it fits a
+    BigIntegerField. Re-encodes, resizes and light edits of a picture land
+    a few bits apart (photoapp.similar counts them).
+    """
+    pixels = img.convert('L').resize((DHASH_SIZE + 1, DHASH_SIZE), Image.BOX).tobytes()
+    value = 0
+    for row in range(DHASH_SIZE):
+        for col in range(row * (DHASH_SIZE + 1), (row + 1) * (DHASH_SIZE + 1) - 1):
+            value = (value << 1) | (pixels[col] > pixels[col + 1])
+    return value - (1 << 64) if value >> 63 else value
+
+
+@dataclass
+class Rendered:
+    """What render_derivatives makes of one decode."""
+    derivatives: list  # (size, format, file_name, width, height, buffer), smallest size first
+    dhash: int
+    metadata: dict  # read_metadata() of the original
+
+
+def render_derivatives(fp, name, sizes, mode='quality', modern_formats=()):
+    """
+    Decode `fp` once and return a Rendered: (size, format, file_name,
+    width, height, buffer) tuples for the fallback format (following the
+    original's extension) plus each of `modern_formats` for every
+    long-edge size, smallest size first and the fallback first within a
+    size; the dhash of the smallest size, which is already shrunk; and
+    the original's EXIF metadata, read from the same open file.
+    """
+    file_extension, format_type = output_format(name)
+    base_name = os.path.splitext(os.path.basename(name))[0]
+    headroom, reducing_gap = RESIZE_MODES[mode]
+    formats = [(format_type, file_extension)]
+    formats += [(f, MODERN_FORMATS[f]) for f in modern_formats if f != format_type]
+
+    img = Image.open(fp)
+    metadata = read_metadata(img)
+    img = decode_oriented(img, draft_size=round(max(sizes) * headroom))
+    results = []
+    resized = img
+    for size, resized in resize_steps(img, sizes, reducing_gap):
+        step = []
+        for fmt, ext in formats:
+            step.append((
+                size,
+                fmt,
+                f'{base_name}_{size}.{ext}',
+                resized.width,
+                resized.height,
+                encode(resized, fmt),
+            ))
+        results[:0] = step
+    return Rendered(derivatives=results, dhash=dhash(resized), metadata=metadata)
+
+
+def cap_original(fp, name, max_edge, quality=90):
+    """
+    Re-encode an oversized upload with its long edge capped at `max_edge`.
+
+    The pixels keep their stored orientation and the original EXIF block
+    (Orientation tag included) and ICC profile are written back, so the
+    derivative pipeline still rotates it correctly. JPEGs are drafted at
+    the smallest DCT scale covering `max_edge`, and the encoded result is
+    spooled to disk past FILE_UPLOAD_MAX_MEMORY_SIZE rather than held in
+    memory. Returns a File ready to assign to Photo.image.
+    """
+    file_extension, format_type = output_format(name)
+    base_name = os.path.splitext(os.path.basename(name))[0]
+
+    img = Image.open(fp)
+    exif = img.info.get('exif')
+    icc_profile = img.info.get('icc_profile')
+    if img.format == 'JPEG':
+        img.draft(None, fit_within(*img.size, max_edge))
+    if max(img.size) > max_edge:
+        img = img.resize(fit_within(*img.size, max_edge), Image.LANCZOS, reducing_gap=3.0)
+    if format_type == 'JPEG' and img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+
+    save_kwargs = {'quality': quality}
+    if exif:
+        save_kwargs['exif'] = exif
+    if icc_profile:
+        save_kwargs['icc_profile'] = icc_profile
+
+    output = SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    img.save(output, format=format_type, **save_kwargs)
+    output.seek(0)
+    return File(output, name=f'{base_name}.{file_extension}')
@@ -0,0 +1,212 @@
+# photoapp/importer.py
+"""
+Bulk import of a directory of photos (`manage.py import_photos`).
+
+Files are hashed, capped, stored and turned into derivatives in worker
+processes (photoapp.workers); this side resolves metadata and
+inserts rows a batch at a time with bulk_create. bulk_create sends no
+signals, so each batch does by hand what photoapp.signals does for a
+single upload: facet counters, search vectors and cache invalidation.
+"""
+import csv
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from . import invalidation
+from .cache_utils import invalidate_member_counts
+from .counters import bump_facet_counter
+from .models import Photo, PhotoDerivative, Year, GenericTag, PeopleTag, TaggedGeneric, TaggedPeople
+from .search import update_search_vectors
+from .utils import comma_splitter
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+SIDECAR_NAME = 'photos.csv'
+SKIP_LIST_NAME = '.import_photos_done'
+YEAR_DIR = re.compile(r'^\d{4}$')
+
+
+@dataclass
+class PhotoMeta:
+    title: str
+    description: str = ''
+    year: str = ''
+    tags: list = field(default_factory=list)
+    people: list = field(default_factory=list)
+
+
+def read_sidecar(path):
+    """
+    {relative path: PhotoMeta} from a CSV with a header row of file, and any
+    of title, description, year, tags, people (tags/people comma-separated,
+    so quote them).
+    """
+    entries = {}
+    with open(path, newline='', encoding='utf-8-sig') as fp:
+        for row in csv.DictReader(fp):
+            name = (row.get('file') or '').strip()
+            if not name:
+                continue
+            entries[os.path.normpath(name)] = PhotoMeta(
+                title=(row.get('title') or '').strip() or _title_from_name(name),
+                description=(row.get('description') or '').strip(),
+                year=(row.get('year') or '').strip(),
+                tags=comma_splitter(row.get('tags') or ''),
+                people=comma_splitter(row.get('people') or ''),
+            )
+    return entries
+
+
+def _title_from_name(name):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return re.sub(r'[_-]+', ' ', stem).strip()[:64]
+
+
+def meta_from_layout(rel_path):
+    """Folder layout: the first four-digit folder is the year, the folders below it are tags."""
+    folders = os.path.dirname(rel_path).split(os.sep) if os.path.dirname(rel_path) else []
+    year, tags = '', []
+    for i, folder in enumerate(folders):
+        if YEAR_DIR.match(folder):
+            year = folder
+            for tag_folder in folders[i + 1:]:
+                tags += comma_splitter(tag_folder)
+            break
+    return PhotoMeta(title=_title_from_name(rel_path), year=year, tags=tags)
+
+
+# Fields checked before anything is decoded: (PhotoMeta attribute, model, column).
+META_COLUMNS = [
+    ('year', Year, 'year'),
+    ('title', Photo, 'title'),
+    ('description', Photo, 'description'),
+    ('tags', GenericTag, 'name'),
+    ('people', PeopleTag, 'name'),
+]
+
+
+def meta_problems(meta):
+    """Why `meta` can't be inserted (a value too long for its column), or [] if it can."""
+    problems = []
+    for attr, model, column in META_COLUMNS:
+        limit = model._meta.get_field(column).max_length
+        values = getattr(meta, attr)
+        for value in values if isinstance(values, list) else [values]:
+            if len(value) > limit:
+                problems.append(f'{attr} over {limit} characters: {value[:limit]}...')
+    return problems
+
+
+def walk_images(root):
+    """Yield the relative path of every image under `root`, in a stable order."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.relpath(os.path.join(dirpath, name), root)
+
+
+def read_skip_list(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path) as fp:
+        return {line.split()[0] for line in fp if line.strip()}
+
+
+def library_hashes():
+    """Photo.sha256 of every photo already in the library, uploaded or imported."""
+    return set(Photo.objects.exclude(sha256='').values_list('sha256', flat=True).iterator(chunk_size=5000))
+
+
+def append_skip_list(path, imported):
+    """Record (sha256, photo id, relative path) for each photo a committed batch created."""
+    with open(path, 'a') as fp:
+        for digest, photo_id, rel_path in imported:
+            fp.write(f'{digest} {photo_id} {rel_path}\n')
+        fp.flush()
+        os.fsync(fp.fileno())
+
+
+def discard_files(result):
+    """Delete what a worker stored for a file that won't be imported after all."""
+    for name in [result['image']] + [d[2] for d in result['derivatives']]:
+        default_storage.delete(name)
+
+
+# --- rows
+
+class BatchWriter:
+    """Inserts processed photos a batch at a time; caches the year and tag rows it resolves."""
+
+    def __init__(self, submitter):
+        self.submitter = submitter
+        self.photo_type = ContentType.objects.get_for_model(Photo)
+        self._years = {}
+        self._tags = {}
+
+    def _year(self, value):
+        if value not in self._years:
+            self._years[value] = Year.objects.get_or_create(year=value)[0]
+        return self._years[value]
+
+    def _tag(self, model, name):
+        # Tags are case-insensitive (TAGGIT_CASE_INSENSITIVE), like the forms.
+        key = (model, name.lower())
+        if key not in self._tags:
+            tag = model.objects.filter(name__iexact=name).first()
+            self._tags[key] = tag or model.objects.create(name=name)
+        return self._tags[key]
+
+    def _insert(self, items):
+        with transaction.atomic():
+            photos = []
+            for meta, result in items:
+                photo = Photo(title=meta.title, description=meta.description, year=self._year(meta.year),
+                              image=result['image'], thumbnail=result['derivatives'][0][2], derivatives_ready=True,
+                              sha256=result['sha256'], dhash=result['dhash'], submitter=self.submitter)
+                photo.set_metadata(result['metadata'])
+                photos.append(photo)
+            photos = Photo.objects.bulk_create(photos)
+            PhotoDerivative.objects.bulk_create([
+                PhotoDerivative(photo=photo, size=size, format=format_type, image=name, width=width, height=height)
+                for photo, (_, result) in zip(photos, items)
+                for size, format_type, name, width, height in result['derivatives']
+            ])
+
+            counts = {Year: Counter(photo.year_id for photo in photos), GenericTag: Counter(), PeopleTag: Counter()}
+            for through, tag_model, attr in ((TaggedGeneric, GenericTag, 'tags'), (TaggedPeople, PeopleTag, 'people')):
+                rows = []
+                for photo, (meta, _) in zip(photos, items):
+                    tags = {self._tag(tag_model, name).pk for name in getattr(meta, attr)}
+                    rows += [through(content_type=self.photo_type, object_id=photo.pk, tag_id=pk) for pk in tags]
+                    counts[tag_model].update(tags)
+                through.objects.bulk_create(rows)
+
+            for model, counter in counts.items():
+                for pk, n in counter.items():
+                    bump_facet_counter(model, [pk], n)
+            ids = [photo.pk for photo in photos]
+            update_search_vectors(ids)
+        return ids, photos
+
+    def write(self, items):
+        """
+        Insert [(PhotoMeta, worker result)] and return their Photo ids, in
+        order. One transaction; the caches are invalidated once per batch.
+        If it fails, the files the workers stored for the batch are deleted.
+        """
+        try:
+            ids, photos = self._insert(items)
+        except Exception:
+            for _, result in items:
+                discard_files(result)
+            raise
+
+        invalidation.photo_added_or_removed(fingerprinted=any(photo.dhash is not None for photo in photos))
+        invalidate_member_counts()
+        return ids
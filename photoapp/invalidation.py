@@ -0,0 +1,75 @@
+# photoapp/invalidation.py
+"""
+What each kind of change makes stale in the list caches. Called from
+photoapp.signals after the counters are updated; each function retires
+only the facet dropdowns, per-filter counts, grid tiles and detail
+fragments the change can reach. Comment and favorite counters move the
+photo version themselves (photoapp.counters.bump_photo_counter).
+"""
+from django.db.models import F, Q
+
+from .cache_utils import bump_count_ver, bump_similar_ver, invalidate_facet_cache
+from .models import Photo
+
+
+def bump_tile_versions(*args, **filters):
+    """Retire the cached grid tiles and detail fragments of the photos matching the filters."""
+    Photo.objects.filter(*args, **filters).update(version=F('version') + 1)
+
+
+def photo_added_or_removed(fingerprinted=True):
+    # Shifts every count; its year and tags move in the dropdowns.
+    invalidate_facet_cache()
+    bump_count_ver()
+    if fingerprinted:  # only photos with a dhash are in the similar index
+        fingerprints_changed()
+
+
+def fingerprints_changed():
+    """Photo.dhash values came, went or moved: rebuild the similar-photo index."""
+    bump_similar_ver()
+
+
+def photo_edited(photo_id, year_changed=False, text_changed=False):
+    if year_changed:
+        invalidate_facet_cache('year')
+        bump_count_ver('year', 'search')
+    if text_changed:
+        bump_count_ver('search')
+    bump_tile_versions(pk=photo_id)  # title, year, thumbnail...
+
+
+def tags_changed(scope, photo_ids):
+    """`scope` is 'tag' or 'person'; tags aren't on tiles, but the detail shows them."""
+    invalidate_facet_cache('tag' if scope == 'tag' else 'people')
+    bump_count_ver(scope, 'search')
+    bump_tile_versions(pk__in=photo_ids)
+
+
+def tag_renamed(scope, photo_ids):
+    """A tag or person renamed in place (e.g. from the admin); `photo_ids` carry it."""
+    tags_changed(scope, photo_ids)
+
+
+def year_renamed(year_id):
+    """A Year renamed in place (e.g. from the admin); tiles and the detail show it."""
+    invalidate_facet_cache('year')
+    bump_count_ver('year', 'search')
+    bump_tile_versions(year_id=year_id)
+
+
+def comment_edited(photo_id):
+    # Only the detail shows comment text; the counters didn't move.
+    bump_tile_versions(pk=photo_id)
+
+
+def favorites_changed():
+    bump_count_ver('favorites')
+
+
+def member_renamed(user_id):
+    # ?member= and ?favorites= match on names; tiles show the submitter,
+    # the detail also the editor, who favorited it and who commented.
+    bump_count_ver('member', 'favorites')
+    bump_tile_versions(Q(submitter_id=user_id) | Q(edited_by_id=user_id) | Q(favorite__user_id=user_id)
+                       | Q(comments__submitter_id=user_id))
@@ -0,0 +1,72 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from photoapp.image_utils import DHASH_MASK
+from photoapp.models import Photo
+from photoapp.similar import MAX_DISTANCE, HashIndex
+
+
+def _synthetic(count, seed):
+    # Random hashes, a fifth of them near copies (bursts, re-encodes) of an earlier one.
+    rng = random.Random(seed)
+    hashes = []
+    for pk in range(1, count + 1):
+        if hashes and rng.random() < 0.2:
+            value = rng.choice(hashes)
+            for bit in rng.sample(range(64), rng.randint(0, MAX_DISTANCE)):
+                value ^= 1 << bit
+        else:
+            value = rng.getrandbits(64)
+        hashes.append(value)
+    return list(enumerate(hashes, 1))
+
+
+class Command(BaseCommand):
+    help = "Time the similar-photo index: build, and neighbour lookups against the full-scan baseline."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--photos', type=int, default=100_000, help='Synthetic hashes to index.')
+        parser.add_argument('--library', action='store_true',
+                            help='Index the hashes of the photos in the database instead.')
+        parser.add_argument('--queries', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if options['library']:
+            rows = list(Photo.objects.filter(dhash__isnull=False).values_list('id', 'dhash'))
+            if not rows:
+                raise CommandError('No photo has a dhash yet; run rebuild_thumbnails --only-missing.')
+        else:
+            rows = _synthetic(options['photos'], options['seed'])
+
+        started = time.perf_counter()
+        index = HashIndex(rows)
+        self.stdout.write(f'{len(index)} hashes indexed in {(time.perf_counter() - started) * 1000:.0f} ms')
+
+        rng = random.Random(options['seed'])
+        queries = [rng.choice(rows) for _ in range(options['queries'])]
+        timings, matches = [], []
+        for pk, value in queries:
+            start = time.perf_counter()
+            found = index.near(value, exclude=pk)
+            timings.append((time.perf_counter() - start) * 1000)
+            matches.append(len(found))
+
+        # The same answers by comparing against every hash.
+        baseline = []
+        for pk, value in queries[:50]:
+            start = time.perf_counter()
+            expected = sorted(((value ^ other) & DHASH_MASK).bit_count() for other_pk, other in rows
+                              if other_pk != pk and ((value ^ other) & DHASH_MASK).bit_count() <= MAX_DISTANCE)
+            baseline.append((time.perf_counter() - start) * 1000)
+            if expected != [d for d, _ in index.near(value, exclude=pk)]:
+                raise CommandError(f'Index and full scan disagree for hash {value:#x}')
+
+        timings.sort()
+        self.stdout.write(f'lookup ms: median {statistics.median(timings):.3f}, '
+                          f'p99 {timings[int(len(timings) * 0.99) - 1]:.3f}, max {timings[-1]:.3f} '
+                          f'({statistics.mean(matches):.1f} matches on average)')
+        self.stdout.write(f'full scan ms: median {statistics.median(baseline):.1f}')
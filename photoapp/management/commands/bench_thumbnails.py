@@ -0,0 +1,114 @@
+import ctypes
+import multiprocessing
+import os
+import resource
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from photoapp.image_utils import RESIZE_MODES, open_oriented, output_format, render_derivatives
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def _legacy_thumbnail(fp, name):
+    # The thumbnail path as it was before derivatives: full decode,
+    # EXIF rotate, LANCZOS thumbnail, quality=95.
+    img = open_oriented(fp)
+    img.thumbnail((360, 360), Image.LANCZOS)
+    output = BytesIO()
+    img.save(output, format=output_format(name)[1], quality=95)
+    return output
+
+
+def _reset_peak_rss():
+    # Linux: hand freed heap back to the OS, then reset the RSS high-water
+    # mark so the worker's import spike doesn't mask the decode itself.
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+    try:
+        with open('/proc/self/clear_refs', 'w') as fp:
+            fp.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss_kib():
+    # VmHWM rather than ru_maxrss: the latter survives exec, so a spawned
+    # worker would report the parent's peak.
+    try:
+        with open('/proc/self/status') as fp:
+            for line in fp:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _run_variant(path, variant, sizes, repeat):
+    # Runs in a fresh process so the peak reflects this variant only.
+    _reset_peak_rss()
+    base_rss = _peak_rss_kib()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with open(path, 'rb') as fp:
+            if variant == 'legacy':
+                _legacy_thumbnail(fp, path)
+            else:
+                render_derivatives(fp, path, sizes, mode=variant)
+        timings.append(time.perf_counter() - start)
+    peak_rss = _peak_rss_kib()
+    return min(timings), statistics.median(timings), base_rss, peak_rss
+
+
+class Command(BaseCommand):
+    help = 'Compare wall time and peak RSS of the thumbnail pipeline variants.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*',
+                            help='Images or directories (default: MEDIA_ROOT/source).')
+        parser.add_argument('--sizes',
+                            help='Comma-separated long-edge sizes for the new pipeline (default: '
+                                 'PHOTO_DERIVATIVE_SIZES, as uploads render them; 360 matches the legacy '
+                                 'thumbnail alone).')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        paths = self._collect(options['paths'] or [os.path.join(settings.MEDIA_ROOT, 'source')])
+        sizes = (tuple(int(s) for s in options['sizes'].split(',')) if options['sizes']
+                 else tuple(settings.PHOTO_DERIVATIVE_SIZES))
+        variants = ['legacy'] + list(RESIZE_MODES)
+        ctx = multiprocessing.get_context('spawn')
+
+        self.stdout.write(f"{'image':32} {'variant':8} {'best ms':>9} {'median ms':>10} "
+                          f"{'peak MiB':>9} {'delta MiB':>9}")
+        for path in paths:
+            for variant in variants:
+                with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                    best, median, base_rss, peak_rss = pool.submit(
+                        _run_variant, path, variant, sizes, options['repeat']).result()
+                self.stdout.write(f'{os.path.basename(path)[:32]:32} {variant:8} {best * 1000:9.1f} '
+                                  f'{median * 1000:10.1f} {peak_rss / 1024:9.1f} '
+                                  f'{(peak_rss - base_rss) / 1024:9.1f}')
+
+    def _collect(self, paths):
+        found = []
+        for path in paths:
+            if os.path.isdir(path):
+                for name in sorted(os.listdir(path)):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        found.append(os.path.join(path, name))
+            elif os.path.isfile(path):
+                found.append(path)
+            else:
+                raise CommandError(f'No such file or directory: {path}')
+        return found
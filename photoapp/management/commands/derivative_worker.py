@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError
+
+from photoapp.derivatives import claim_next_job, run_job, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = 'Build thumbnails and other derivatives for uploaded photos from the job queue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the queue and exit instead of polling.')
+        parser.add_argument('--sleep', type=float, default=2.0,
+                            help='Seconds to wait between polls when the queue is empty.')
+        parser.add_argument('--stale', type=int, default=600,
+                            help='Requeue jobs that have been running for this many seconds.')
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs(options['stale'])
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} stale job(s)')
+
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+
+            # One bad job must not stop the worker; a stuck RUNNING one is requeued as stale.
+            try:
+                ok = run_job(job)
+            except DatabaseError as exc:
+                self.stderr.write(f'Photo {job.photo_id}: {exc}')
+                continue
+            if ok:
+                self.stdout.write(f'Photo {job.photo_id}: derivatives ready')
+            else:
+                self.stderr.write(f'Photo {job.photo_id}: attempt {job.attempts} failed ({job.status})')
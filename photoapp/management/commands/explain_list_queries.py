@@ -0,0 +1,112 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from photoapp.models import Photo, Year, GenericTag, PeopleTag
+from photoapp.pagination import KEYSET_ORDERINGS, PAGE_SIZE, keyset_queryset
+from photoapp.queries import LIST_ANNOTATIONS, SORTS, photo_list_query
+
+# Tables whose sequential scans on the list queries mean an index went missing.
+WATCHED_TABLES = ('photoapp_photo', 'photoapp_taggedgeneric', 'photoapp_taggedpeople', 'photoapp_favorite')
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN every photo list query shape (each filter x each sort, page, count and cursor)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true',
+                            help='Run EXPLAIN ANALYZE (executes the queries; PostgreSQL adds BUFFERS).')
+        parser.add_argument('--check', action='store_true',
+                            help='PostgreSQL: disable seq scans and fail if a plan still needs one on '
+                                 'the list tables, i.e. no index can serve that shape.')
+        parser.add_argument('--filter', dest='filters', action='append',
+                            help='Only these filters (none, favorites, member, tag, year, person, search).')
+
+    def handle(self, *args, **options):
+        postgres = connection.vendor == 'postgresql'
+        if (options['check'] or options['analyze']) and not postgres:
+            raise CommandError('--check and --analyze need PostgreSQL.')
+        explain_prefix = connection.ops.explain_query_prefix(
+            **({'analyze': True, 'buffers': True} if options['analyze'] else {}))
+
+        shapes = self._filter_params()
+        if options['filters']:
+            unknown = set(options['filters']) - set(shapes)
+            if unknown:
+                raise CommandError(f'Unknown filter(s): {", ".join(sorted(unknown))}')
+            shapes = {name: shapes[name] for name in options['filters']}
+
+        failures = []
+        with connection.cursor() as cursor:
+            if options['check']:
+                cursor.execute('SET enable_seqscan = off')
+            try:
+                for name, params in shapes.items():
+                    for sort_by in [None, *SORTS]:
+                        query_params = dict(params, **({'sort_by': sort_by} if sort_by else {}))
+                        for label, run in self._queries(query_params):
+                            title = f'{name} / {sort_by or "createddesc"} / {label}'
+                            sql, sql_params = _list_query(run)
+                            cursor.execute(f'{explain_prefix} {sql}', sql_params)
+                            plan = '\n'.join(' '.join(str(col) for col in row) for row in cursor.fetchall())
+                            self.stdout.write(self.style.MIGRATE_HEADING(title))
+                            self.stdout.write(plan + '\n')
+                            scans = [t for t in WATCHED_TABLES if f'Seq Scan on {t}' in plan]
+                            if scans and postgres:
+                                self.stdout.write(self.style.WARNING(f'  seq scan on {", ".join(scans)}'))
+                                failures.append(title)
+            finally:
+                if options['check']:
+                    cursor.execute('RESET enable_seqscan')
+
+        if options['check'] and failures:
+            raise CommandError(f'{len(failures)} query shape(s) need a sequential scan:\n  '
+                               + '\n  '.join(failures))
+
+    def _filter_params(self):
+        # One real value per filter, so the planner sees realistic selectivity.
+        shapes = {'none': {}}
+        user = get_user_model().objects.exclude(first_name='').order_by('id').first()
+        if user:
+            name = f'{user.first_name} {user.last_name}'.strip()
+            shapes['favorites'] = {'favorites': name}
+            shapes['member'] = {'member': name}
+        samples = {
+            'tag': GenericTag.objects.order_by('id').values_list('name', flat=True).first(),
+            'year': Year.objects.order_by('-year').values_list('year', flat=True).first(),
+            'person': PeopleTag.objects.order_by('id').values_list('name', flat=True).first(),
+        }
+        for name, value in samples.items():
+            if value:
+                shapes[name] = {name: value}
+        shapes['search'] = {'search': samples['tag'] or 'photo'}
+        return shapes
+
+    def _queries(self, params):
+        """(label, callable running the query) for each query the list view can run for `params`."""
+        qs, sort, ranked, _, _ = photo_list_query(params)
+        yield 'count', qs.count
+        yield 'page 1', lambda: list(qs[:PAGE_SIZE])
+        if ranked:
+            return
+        yield 'page 10 (offset)', lambda: list(qs[9 * PAGE_SIZE:10 * PAGE_SIZE])
+        # A cursor from the middle of the table, as a deep page would carry.
+        field, _ = KEYSET_ORDERINGS[sort]
+        middle = (Photo.objects.annotate(**LIST_ANNOTATIONS).order_by('created', 'id')
+                  .values_list(field, 'id')[Photo.objects.count() // 2:][:1])
+        for cursor in middle:
+            yield 'cursor', lambda: list(keyset_queryset(qs, sort, cursor)[:PAGE_SIZE + 1])
+
+
+def _list_query(run):
+    """Run `run()` and return (sql, params) of its first query on Photo, exactly as executed."""
+    captured = []
+
+    def capture(execute, sql, params, many, context):
+        captured.append((sql, params))
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(capture):
+        run()
+    # Skips content type lookups before it and the derivatives prefetch after it.
+    return next(q for q in captured if '"photoapp_photo"' in q[0])
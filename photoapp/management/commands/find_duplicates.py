@@ -0,0 +1,79 @@
+import os
+import time
+from itertools import groupby
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.urls import reverse
+
+from photoapp.derivatives import upload_dirs
+from photoapp.models import Photo
+from photoapp.workers import bounded_map, hash_stored, worker_pool
+
+
+class Command(BaseCommand):
+    help = ("Hash the stored originals of photos that have no SHA-256 yet, across a process pool, "
+            "then report clusters of photos with identical content.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--report-only', action='store_true',
+                            help='Report from the hashes already stored; read no files.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Hashing processes (default: one per CPU).')
+        parser.add_argument('--batch-size', type=int, default=500, help='Hashes per bulk write.')
+
+    def handle(self, *args, **options):
+        if not options['report_only']:
+            self._hash(options)
+        self._report()
+
+    def _hash(self, options):
+        # Only photos with no hash: one taken at upload or import is of the file as sent,
+        # before ingest_original capped it, and the stored file would no longer match it.
+        photos = Photo.objects.filter(sha256='').order_by('id')
+        total = photos.count()
+        self.stdout.write(f'{total} photo(s) to hash')
+        if not total:
+            return
+
+        tasks = photos.values_list('id', 'image').iterator(chunk_size=2000)
+        stats = {'done': 0, 'failed': 0}
+        started = time.monotonic()
+        batch = []
+        with worker_pool(options['workers'], upload_dirs()) as pool:
+            for _, result in bounded_map(pool, hash_stored, tasks, options['workers'] * 4):
+                if result.get('error'):
+                    stats['failed'] += 1
+                    self.stderr.write(f'Photo {result["id"]}: {result["error"]}')
+                    continue
+                batch.append(Photo(pk=result['id'], sha256=result['sha256']))
+                if len(batch) >= options['batch_size']:
+                    self._flush(batch, stats, total, started)
+                    batch = []
+            if batch:
+                self._flush(batch, stats, total, started)
+        self.stdout.write(f'{stats["done"]} hashed, {stats["failed"]} failed')
+
+    def _flush(self, batch, stats, total, started):
+        # sha256 isn't shown anywhere, so no version bump or cache invalidation.
+        Photo.objects.bulk_update(batch, ['sha256'])
+        stats['done'] += len(batch)
+        rate = stats['done'] / max(time.monotonic() - started, 1e-6)
+        self.stdout.write(f'  {stats["done"]}/{total} ({rate:.1f} photos/s)')
+
+    def _report(self):
+        digests = (Photo.objects.exclude(sha256='').values('sha256')
+                   .annotate(n=Count('id')).filter(n__gt=1).values_list('sha256', flat=True))
+        photos = (Photo.objects.filter(sha256__in=digests)
+                  .select_related('year', 'submitter').order_by('sha256', 'created', 'id'))
+        clusters = redundant = 0
+        for digest, group in groupby(photos.iterator(chunk_size=2000), key=lambda photo: photo.sha256):
+            group = list(group)
+            clusters += 1
+            redundant += len(group) - 1
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{digest[:16]}  {len(group)} copies'))
+            for photo in group:
+                self.stdout.write(f'  #{photo.pk} "{photo.title}" ({photo.year}) by {photo.submitter.email}, '
+                                  f'{photo.created:%Y-%m-%d}  {reverse("photo:detail", args=[photo.pk])}')
+        style = self.style.WARNING if clusters else self.style.SUCCESS
+        self.stdout.write(style(f'{clusters} duplicate cluster(s), {redundant} redundant photo(s)'))
@@ -0,0 +1,109 @@
+import os
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from photoapp.derivatives import upload_dirs
+from photoapp.importer import (SIDECAR_NAME, SKIP_LIST_NAME, BatchWriter, append_skip_list, discard_files,
+                               library_hashes, meta_from_layout, meta_problems, read_sidecar, read_skip_list,
+                               walk_images)
+from photoapp.workers import bounded_map, process_file, worker_pool
+
+
+class Command(BaseCommand):
+    help = ("Import a directory tree of photos. Year, tags and people come from a sidecar CSV "
+            f"({SIDECAR_NAME}: file,title,description,year,tags,people) or else the folder layout "
+            "(<year>/<tag>/.../photo.jpg). Files already in the library or imported by an earlier run "
+            "are skipped (by SHA-256).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--submitter', required=True, help='Email of the member the photos are added as.')
+        parser.add_argument('--csv', help=f'Sidecar CSV (default: <directory>/{SIDECAR_NAME} if present).')
+        parser.add_argument('--year', dest='default_year',
+                            help='Year for photos neither the CSV nor the folders give one.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Decoding processes (default: one per CPU).')
+        parser.add_argument('--batch-size', type=int, default=200, help='Photos per bulk insert.')
+        parser.add_argument('--skip-list',
+                            help=f'File of imported hashes, appended per batch (default: <directory>/{SKIP_LIST_NAME}).')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only resolve and report the metadata; decode and store nothing.')
+
+    def handle(self, *args, **options):
+        root = options['directory']
+        if not os.path.isdir(root):
+            raise CommandError(f'No such directory: {root}')
+        try:
+            submitter = get_user_model().objects.get(email__iexact=options['submitter'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'No member with email {options["submitter"]}')
+
+        csv_path = options['csv'] or os.path.join(root, SIDECAR_NAME)
+        sidecar = read_sidecar(csv_path) if os.path.exists(csv_path) else {}
+        if options['csv'] and not sidecar:
+            raise CommandError(f'No rows in {csv_path}')
+        skip_list = options['skip_list'] or os.path.join(root, SKIP_LIST_NAME)
+        done = read_skip_list(skip_list) | library_hashes()
+        self.stdout.write(f'{len(sidecar)} sidecar row(s), {len(done)} known file hash(es)')
+
+        # Metadata is resolved and checked up front so a missing year or a value too long
+        # for its column fails before any decoding, not as a rolled-back batch.
+        files, no_year, invalid = [], [], 0
+        for rel_path in walk_images(root):
+            meta = sidecar.get(rel_path) or meta_from_layout(rel_path)
+            meta.year = meta.year or options['default_year'] or ''
+            problems = meta_problems(meta)
+            if not meta.year:
+                no_year.append(rel_path)
+            elif problems:
+                invalid += 1
+                self.stderr.write(f'{rel_path}: {"; ".join(problems)}, skipped')
+            else:
+                files.append((rel_path, meta))
+        for rel_path in no_year:
+            self.stderr.write(f'No year, skipped: {rel_path}')
+        if options['dry_run']:
+            for rel_path, meta in files:
+                self.stdout.write(f'{rel_path}: {meta.year} "{meta.title}" tags={meta.tags} people={meta.people}')
+            self.stdout.write(f'{len(files)} file(s) to check, {len(no_year)} without a year, {invalid} invalid')
+            return
+
+        writer = BatchWriter(submitter)
+        stats = {'imported': 0, 'skipped': 0, 'failed': 0}
+        started = time.monotonic()
+        batch = []
+        with worker_pool(options['workers'], upload_dirs(), done) as pool:
+            for (rel_path, meta), result in bounded_map(pool, process_file, files, options['workers'] * 4,
+                                                        arg=lambda item: os.path.join(root, item[0])):
+                if result.get('error'):
+                    stats['failed'] += 1
+                    self.stderr.write(f'{rel_path}: {result["error"]}')
+                elif result.get('skipped') or result['sha256'] in done:
+                    if not result.get('skipped'):
+                        discard_files(result)  # same content twice in this run
+                    stats['skipped'] += 1
+                else:
+                    done.add(result['sha256'])
+                    batch.append((rel_path, meta, result))
+                if len(batch) >= options['batch_size']:
+                    self._flush(writer, batch, skip_list, stats, started)
+                    batch = []
+            if batch:
+                self._flush(writer, batch, skip_list, stats, started)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {stats["imported"]}, skipped {stats["skipped"]} already in the library, '
+            f'{stats["failed"]} failed, {len(no_year)} without a year, {invalid} invalid'))
+
+    def _flush(self, writer, batch, skip_list, stats, started):
+        ids = writer.write([(meta, result) for _, meta, result in batch])
+        # Only after the rows are committed, so a crash re-imports rather than loses.
+        append_skip_list(skip_list, [(result['sha256'], photo_id, rel_path)
+                                     for (rel_path, _, result), photo_id in zip(batch, ids)])
+        stats['imported'] += len(ids)
+        rate = stats['imported'] / max(time.monotonic() - started, 1e-6)
+        self.stdout.write(f'  {stats["imported"]} imported, {stats["skipped"]} skipped, '
+                          f'{stats["failed"]} failed ({rate:.1f} photos/s)')
+
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from photoapp.search import full_text_enabled, update_search_vectors
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search vectors on Photo (PostgreSQL only)."
+
+    def handle(self, *args, **options):
+        if not full_text_enabled():
+            raise CommandError('Full-text search needs PostgreSQL; other databases search with icontains.')
+        updated = update_search_vectors()
+        self.stdout.write(f'Search index: {updated} photo(s) rebuilt')
@@ -0,0 +1,81 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.utils.dateparse import parse_date
+
+from photoapp.derivatives import replace_derivatives, stored_bytes, stored_derivative_files, upload_dirs
+from photoapp.models import Photo
+from photoapp.workers import bounded_map, rebuild_file, worker_pool
+
+
+def _mib(n):
+    return f'{n / (1024 * 1024):.1f} MiB'
+
+
+class Command(BaseCommand):
+    help = ("Re-render the derivatives of existing photos with the current PHOTO_DERIVATIVE_* settings, "
+            "across a process pool, writing the rows back in batches.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only photos added on or after this date (YYYY-MM-DD).')
+        parser.add_argument('--only-missing', action='store_true',
+                            help='Only photos whose derivatives (or similarity hash and EXIF '
+                                 'metadata) were never built.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Rendering processes (default: one per CPU).')
+        parser.add_argument('--batch-size', type=int, default=100, help='Photos per bulk write.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Render in memory and report the bytes the rebuild would save; write nothing.')
+
+    def handle(self, *args, **options):
+        photos = Photo.objects.order_by('id')
+        if options['since']:
+            since = parse_date(options['since'])
+            if since is None:
+                raise CommandError(f'--since takes a date (YYYY-MM-DD), not {options["since"]!r}')
+            photos = photos.filter(created__date__gte=since)
+        if options['only_missing']:
+            photos = photos.filter(Q(derivatives_ready=False) | Q(thumbnail='') | Q(dhash__isnull=True)
+                                   | Q(width__isnull=True))
+        total = photos.count()
+        self.stdout.write(f'{total} photo(s) to rebuild{" (dry run)" if options["dry_run"] else ""}')
+
+        dry_run = options['dry_run']
+        # Ids and names only, streamed: memory stays flat however large the library.
+        tasks = ((pk, name, dry_run) for pk, name in photos.values_list('id', 'image').iterator(chunk_size=2000))
+        stats = {'done': 0, 'failed': 0, 'old_bytes': 0, 'new_bytes': 0}
+        started = time.monotonic()
+        batch = {}
+        with worker_pool(options['workers'], upload_dirs()) as pool:
+            for _, result in bounded_map(pool, rebuild_file, tasks, options['workers'] * 4):
+                if result.get('error'):
+                    stats['failed'] += 1
+                    self.stderr.write(f'Photo {result["id"]}: {result["error"]}')
+                    continue
+                batch[result['id']] = result
+                if len(batch) >= options['batch_size']:
+                    self._flush(batch, dry_run, stats, total, started)
+                    batch = {}
+            if batch:
+                self._flush(batch, dry_run, stats, total, started)
+
+        saved = stats['old_bytes'] - stats['new_bytes']
+        verb = 'would save' if dry_run else 'saved'
+        self.stdout.write(self.style.SUCCESS(
+            f'{stats["done"]} rebuilt, {stats["failed"]} failed: {_mib(stats["old_bytes"])} -> '
+            f'{_mib(stats["new_bytes"])}, {verb} {_mib(saved)}'))
+
+    def _flush(self, batch, dry_run, stats, total, started):
+        old_files = stored_derivative_files(list(batch))
+        stats['old_bytes'] += sum(stored_bytes(names) for names in old_files.values())
+        stats['new_bytes'] += sum(result['bytes'] for result in batch.values())
+        if not dry_run:
+            stale = replace_derivatives(batch)
+            for name in stale:
+                default_storage.delete(name)
+        stats['done'] += len(batch)
+        rate = stats['done'] / max(time.monotonic() - started, 1e-6)
+        self.stdout.write(f'  {stats["done"]}/{total} ({rate:.1f} photos/s)')
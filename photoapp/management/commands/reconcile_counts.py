@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from photoapp.cache_utils import invalidate_facet_cache
+from photoapp.counters import reconcile_facet_counters, reconcile_photo_counters
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized comment/favorite counters on Photo and the tag/people/year facet counts."
+
+    def handle(self, *args, **options):
+        fixed = reconcile_photo_counters()
+        self.stdout.write(f'Photo counters: {fixed} row(s) corrected')
+        fixed = reconcile_facet_counters()
+        if fixed:
+            invalidate_facet_cache()
+        self.stdout.write(f'Facet counters: {fixed} row(s) corrected')
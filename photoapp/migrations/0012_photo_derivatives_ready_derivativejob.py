@@ -0,0 +1,46 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def mark_existing_ready(apps, schema_editor):
+    # Photos uploaded before the queue existed already have thumbnails.
+    Photo = apps.get_model('photoapp', 'Photo')
+    Photo.objects.exclude(thumbnail='').update(derivatives_ready=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photoapp', '0011_alter_photo_year'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='comment',
+            options={'ordering': ['created', 'id']},
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='derivatives_ready',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_existing_ready, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='DerivativeJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=8)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('photo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='derivative_jobs', to='photoapp.photo')),
+            ],
+            options={
+                'ordering': ['created', 'id'],
+                'indexes': [models.Index(fields=['status', 'created'], name='photoapp_de_status_dd3df7_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def queue_existing_photos(apps, schema_editor):
+    # Existing photos only have the single 360px thumbnail; let the
+    # derivative worker backfill the responsive sizes.
+    Photo = apps.get_model('photoapp', 'Photo')
+    DerivativeJob = apps.get_model('photoapp', 'DerivativeJob')
+    DerivativeJob.objects.bulk_create(
+        DerivativeJob(photo_id=pk) for pk in Photo.objects.exclude(image='').values_list('pk', flat=True)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photoapp', '0012_photo_derivatives_ready_derivativejob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PhotoDerivative',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('size', models.PositiveSmallIntegerField()),
+                ('image', models.ImageField(upload_to='derivatives/%Y%m')),
+                ('width', models.PositiveSmallIntegerField()),
+                ('height', models.PositiveSmallIntegerField()),
+                ('photo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='derivatives', to='photoapp.photo')),
+            ],
+            options={
+                'ordering': ['size'],
+                'constraints': [models.UniqueConstraint(fields=('photo', 'size'), name='unique_photo_derivative_size')],
+            },
+        ),
+        migrations.RunPython(queue_existing_photos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:41
+
+import os
+
+from django.db import migrations, models
+
+
+FORMATS_BY_EXTENSION = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.webp': 'WEBP'}
+
+
+def fill_format(apps, schema_editor):
+    PhotoDerivative = apps.get_model('photoapp', 'PhotoDerivative')
+    for derivative in PhotoDerivative.objects.only('id', 'image'):
+        ext = os.path.splitext(derivative.image.name)[1].lower()
+        derivative.format = FORMATS_BY_EXTENSION.get(ext, 'JPEG')
+        derivative.save(update_fields=['format'])
+
+
+def queue_ready_photos(apps, schema_editor):
+    # Photos whose derivatives are already built only have the fallback
+    # format; queue them so the worker adds the WebP/AVIF variants.
+    Photo = apps.get_model('photoapp', 'Photo')
+    DerivativeJob = apps.get_model('photoapp', 'DerivativeJob')
+    pending = DerivativeJob.objects.filter(status='pending').values('photo_id')
+    DerivativeJob.objects.bulk_create(
+        DerivativeJob(photo_id=pk)
+        for pk in Photo.objects.exclude(image='').exclude(pk__in=pending).values_list('pk', flat=True)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photoapp', '0013_photoderivative'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='photoderivative',
+            name='unique_photo_derivative_size',
+        ),
+        migrations.AddField(
+            model_name='photoderivative',
+            name='format',
+            field=models.CharField(default='JPEG', max_length=4),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_format, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='photoderivative',
+            constraint=models.UniqueConstraint(fields=('photo', 'size', 'format'), name='unique_photo_derivative'),
+        ),
+        migrations.RunPython(queue_ready_photos, migrations.RunPython.noop),
+    ]
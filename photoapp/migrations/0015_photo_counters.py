@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:24
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    Photo = apps.get_model('photoapp', 'Photo')
+    Comment = apps.get_model('photoapp', 'Comment')
+    Favorite = apps.get_model('photoapp', 'Favorite')
+
+    def count_of(model, fk):
+        return Coalesce(Subquery(
+            model.objects.filter(**{fk: OuterRef('pk')}).order_by()
+            .values(fk).annotate(n=Count('id')).values('n')
+        ), 0)
+
+    Photo.objects.update(
+        comments_count=count_of(Comment, 'photo'),
+        favorites_count=count_of(Favorite, 'favorite'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photoapp', '0014_photoderivative_format'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:26
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery, TextField, Value
+from django.db.models.functions import Coalesce
+
+
+SEARCH_INDEX = django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='photo_search_vector_gin')
+
+
+def add_search_index(apps, schema_editor):
+    # GIN is PostgreSQL-only; other backends (dev SQLite) keep the icontains search.
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.add_index(apps.get_model('photoapp', 'Photo'), SEARCH_INDEX)
+
+
+def remove_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.remove_index(apps.get_model('photoapp', 'Photo'), SEARCH_INDEX)
+
+
+def populate_search_vectors(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Photo = apps.get_model('photoapp', 'Photo')
+    Year = apps.get_model('photoapp', 'Year')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    content_type, _ = ContentType.objects.get_or_create(app_label='photoapp', model='photo')
+
+    def names_of(through_name):
+        through = apps.get_model('photoapp', through_name)
+        return Coalesce(Subquery(
+            through.objects.filter(content_type=content_type, object_id=OuterRef('pk')).order_by()
+            .values('object_id').annotate(names=StringAgg('tag__name', ' ')).values('names')
+        ), Value(''), output_field=TextField())
+
+    year = Subquery(Year.objects.filter(pk=OuterRef('year_id')).order_by().values('year'))
+    Photo.objects.update(search_vector=(
+        SearchVector('title', weight='A', config='english')
+        + SearchVector(names_of('TaggedGeneric'), names_of('TaggedPeople'), weight='A', config='simple')
+        + SearchVector(year, weight='B', config='simple')
+        + SearchVector('description', weight='C', config='english')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('photoapp', '0015_photo_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name='photo', index=SEARCH_INDEX),
+            ],
+            database_operations=[
+                migrations.RunPython(add_search_index, remove_search_index),
+            ],
+        ),
+        migrations.RunPython(populate_search_vectors, migrations.RunPython.noop),
+    ]
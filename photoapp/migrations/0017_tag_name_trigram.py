@@ -0,0 +1,44 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:27
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+TRIGRAM_INDEXES = [
+    ('GenericTag', django.contrib.postgres.indexes.GinIndex(fields=['name'], name='generictag_name_trgm', opclasses=['gin_trgm_ops'])),
+    ('PeopleTag', django.contrib.postgres.indexes.GinIndex(fields=['name'], name='peopletag_name_trgm', opclasses=['gin_trgm_ops'])),
+]
+
+
+def add_trigram_indexes(apps, schema_editor):
+    # gin_trgm_ops needs pg_trgm; other backends use the in-process fallback.
+    if schema_editor.connection.vendor == 'postgresql':
+        for model_name, index in TRIGRAM_INDEXES:
+            schema_editor.add_index(apps.get_model('photoapp', model_name), index)
+
+
+def remove_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for model_name, index in TRIGRAM_INDEXES:
+            schema_editor.remove_index(apps.get_model('photoapp', model_name), index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photoapp', '0016_photo_search_vector'),
+    ]
+
+    operations = [
+        TrigramExtension(),  # no-op off PostgreSQL
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name=model_name.lower(), index=index)
+                for model_name, index in TRIGRAM_INDEXES
+            ],
+            database_operations=[
+                migrations.RunPython(add_trigram_indexes, remove_trigram_indexes),
+            ],
+        ),
+    ]
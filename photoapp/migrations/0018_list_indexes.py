@@ -0,0 +1,69 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:30
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def drop_duplicate_favorites(apps, schema_editor):
+    # Keep the first row of each (user, photo) pair so the unique
+    # constraint can be added, then fix the denormalized counters.
+    Favorite = apps.get_model('photoapp', 'Favorite')
+    Photo = apps.get_model('photoapp', 'Photo')
+    duplicates = (Favorite.objects.values('user', 'favorite').order_by()
+                  .annotate(keep=Min('id'), n=Count('id')).filter(n__gt=1))
+    photo_ids = set()
+    for row in duplicates:
+        Favorite.objects.filter(user=row['user'], favorite=row['favorite']).exclude(id=row['keep']).delete()
+        photo_ids.add(row['favorite'])
+    if photo_ids:
+        Photo.objects.filter(pk__in=photo_ids).update(favorites_count=Coalesce(Subquery(
+            Favorite.objects.filter(favorite=OuterRef('pk')).order_by()
+            .values('favorite').annotate(n=Count('id')).values('n')
+        ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('photoapp', '0017_tag_name_trigram'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['created', 'id'], name='photo_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['year', 'created'], name='photo_year_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['submitter', 'created'], name='photo_submitter_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taggedgeneric',
+            index=models.Index(fields=['content_type', 'object_id'], name='taggedgeneric_object_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taggedgeneric',
+            index=models.Index(fields=['tag', 'content_type', 'object_id'], name='taggedgeneric_tag_object_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taggedpeople',
+            index=models.Index(fields=['content_type', 'object_id'], name='taggedpeople_object_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taggedpeople',
+            index=models.Index(fields=['tag', 'content_type', 'object_id'], name='taggedpeople_tag_object_idx'),
+        ),
+        migrations.RunPython(drop_duplicate_favorites, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'favorite'), name='unique_user_favorite'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:32
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_facet_counters(apps, schema_editor):
+    Photo = apps.get_model('photoapp', 'Photo')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    photo_type, _ = ContentType.objects.get_or_create(app_label='photoapp', model='photo')
+
+    def count_of(model, fk, **filters):
+        return Coalesce(Subquery(
+            model.objects.filter(**{fk: OuterRef('pk')}, **filters).order_by()
+            .values(fk).annotate(n=Count('id')).values('n')
+        ), 0)
+
+    apps.get_model('photoapp', 'Year').objects.update(photo_count=count_of(Photo, 'year'))
+    for tag_name, through_name in (('GenericTag', 'TaggedGeneric'), ('PeopleTag', 'TaggedPeople')):
+        through = apps.get_model('photoapp', through_name)
+        apps.get_model('photoapp', tag_name).objects.update(
+            photo_count=count_of(through, 'tag', content_type=photo_type))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('photoapp', '0018_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generictag',
+            name='photo_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='peopletag',
+            name='photo_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='year',
+            name='photo_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_facet_counters, migrations.RunPython.noop),
+    ]
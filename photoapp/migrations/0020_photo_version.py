@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photoapp', '0019_facet_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photoapp', '0020_photo_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='sha256',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['sha256'], name='photo_sha256_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photoapp', '0021_photo_sha256'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='dhash',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:08
+
+from django.core.management import call_command
+from django.db import migrations, models
+
+
+def create_cache_table(apps, schema_editor):
+    # The database cache is the default backend; a no-op for the others.
+    call_command('createcachetable', database=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photoapp', '0023_photo_exif_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('value', models.PositiveBigIntegerField(default=1)),
+            ],
+        ),
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
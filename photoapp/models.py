@@ -1,15 +1,23 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 # from django_resized import ResizedImageField
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from taggit.managers import TaggableManager
 from taggit.models import TagBase, GenericTaggedItemBase
-from PIL import Image, ExifTags
-from io import BytesIO
 from django.core.files import File
+from .image_utils import MODERN_FORMATS, render_derivatives, cap_original, output_format, supported_modern_formats
+from .uploads import upload_sha256
 
 class Year(models.Model):
     year = models.CharField(max_length=5, unique=True)
+    # Denormalized facet count, like GenericTag/PeopleTag.photo_count.
+    photo_count = models.PositiveIntegerField(default=0)
 
     class Meta:
          ordering = ['year']
@@ -19,15 +27,24 @@ class Year(models.Model):
 
 
 class GenericTag(TagBase):
+    # Photos with this tag; kept by photoapp.signals, repaired by `manage.py reconcile_counts`.
+    photo_count = models.PositiveIntegerField(default=0)
 
     class Meta:
+        indexes = [
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='generictag_name_trgm'),
+        ]
         verbose_name = _("Tag")
         verbose_name_plural = _("Tags")
 
 
 class PeopleTag(TagBase):
+    photo_count = models.PositiveIntegerField(default=0)  # as GenericTag.photo_count
 
     class Meta:
+        indexes = [
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='peopletag_name_trgm'),
+        ]
         verbose_name = _("Person")
         verbose_name_plural = _("People")
 
@@ -39,6 +56,13 @@ class TaggedGeneric(GenericTaggedItemBase):
         related_name="%(app_label)s_%(class)s_items",
     )
 
+    class Meta:
+        indexes = [
+            # a photo's tags (prefetch/detail) and a tag's photos (?tag= / ?person=)
+            models.Index(fields=['content_type', 'object_id'], name='taggedgeneric_object_idx'),
+            models.Index(fields=['tag', 'content_type', 'object_id'], name='taggedgeneric_tag_object_idx'),
+        ]
+
 
 class TaggedPeople(GenericTaggedItemBase):
     tag = models.ForeignKey(
@@ -47,6 +71,13 @@ class TaggedPeople(GenericTaggedItemBase):
         related_name="%(app_label)s_%(class)s_items",
     )
 
+    class Meta:
+        indexes = [
+            # a photo's tags (prefetch/detail) and a tag's photos (?tag= / ?person=)
+            models.Index(fields=['content_type', 'object_id'], name='taggedpeople_object_idx'),
+            models.Index(fields=['tag', 'content_type', 'object_id'], name='taggedpeople_tag_object_idx'),
+        ]
+
 
 class Photo(models.Model):
     title = models.CharField(max_length=64)
@@ -54,73 +85,216 @@ class Photo(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     image = models.ImageField(upload_to='photos/%Y%m')
     thumbnail = models.ImageField(blank=True, upload_to='thumbnails/%Y%m')
+    derivatives_ready = models.BooleanField(default=False)
+    # SHA-256 of the original as uploaded (before any capping), for spotting
+    # re-uploads; blank until `manage.py find_duplicates` hashes older photos.
+    sha256 = models.CharField(max_length=64, blank=True, editable=False)
+    # 64-bit difference hash of the picture (image_utils.dhash), set with the
+    # derivatives; photoapp.similar keeps them in memory for neighbour lookups.
+    dhash = models.BigIntegerField(null=True, blank=True, editable=False)
+    # From the original's EXIF (image_utils.read_metadata), also set with the
+    # derivatives; `manage.py rebuild_thumbnails --only-missing` fills older photos.
+    taken = models.DateTimeField(null=True, blank=True, editable=False)
+    camera = models.CharField(max_length=64, blank=True, editable=False)
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    latitude = models.FloatField(null=True, blank=True, editable=False)
+    longitude = models.FloatField(null=True, blank=True, editable=False)
+    # Denormalized; kept current by photoapp.signals, repaired by `manage.py reconcile_counts`.
+    comments_count = models.PositiveIntegerField(default=0)
+    favorites_count = models.PositiveIntegerField(default=0)
+    # Bumped whenever the grid tile would render differently; part of the
+    # tile's cache key (photoapp.tiles).
+    version = models.PositiveIntegerField(default=1)
+    # Full-text document (title, description, tags, people, year); PostgreSQL
+    # only, kept by photoapp.signals, rebuilt by `manage.py rebuild_search_index`.
+    search_vector = SearchVectorField(null=True, editable=False)
     submitter = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name='submitter')
     edited_by = models.ForeignKey(get_user_model(), null=True, on_delete=models.CASCADE, related_name='edited_by')
     year = models.ForeignKey(Year, on_delete=models.CASCADE)
     people = TaggableManager(through=TaggedPeople, verbose_name='People')
     tags = TaggableManager(through=TaggedGeneric, verbose_name='Tags')
 
-    def save(self, *args, **kwargs):
+    MAINTAINED_FIELDS = ('comments_count', 'favorites_count', 'version', 'search_vector')
+    METADATA_FIELDS = ('taken', 'camera', 'width', 'height', 'latitude', 'longitude')
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='photo_search_vector_gin'),
+            # list sorts/filters; `id` matches the keyset pagination tiebreaker
+            models.Index(fields=['created', 'id'], name='photo_created_idx'),
+            models.Index(fields=['year', 'created'], name='photo_year_created_idx'),
+            models.Index(fields=['submitter', 'created'], name='photo_submitter_created_idx'),
+            models.Index(fields=['sha256'], name='photo_sha256_idx'),
+            # the "taken" sorts: capture time, else when it was added (queries.TAKEN_KEY)
+            models.Index(Coalesce('taken', 'created'), F('id'), name='photo_taken_idx'),
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Remember which original was loaded so save() can tell whether the
+        # image actually changed (title/tag edits shouldn't re-decode it).
+        self._loaded_image_name = self._image_name()
+        # ...and which year, so the facet counters can move it between years.
+        self._loaded_year_id = self.__dict__.get('year_id')
+        # ...and which dhash, so only a new one rebuilds the similar-photo index.
+        self._loaded_dhash = self.__dict__.get('dhash')
+
+    def _image_name(self):
+        value = self.__dict__.get('image')
+        return getattr(value, 'name', value) or ''
+
+    def image_changed(self):
+        if not self.image:
+            return False
+        if not getattr(self.image, '_committed', True):
+            return True  # freshly assigned upload
+        return self.image.name != self._loaded_image_name
+
+    def hash_original(self):
+        """Record the SHA-256 of a fresh upload, before ingest_original can re-encode it."""
+        if getattr(self.image, '_committed', True):
+            self.sha256 = ''  # a file already in storage; find_duplicates hashes it
+        else:
+            self.sha256 = upload_sha256(self.image.file)
+
+    def ingest_original(self):
+        """Shrink a fresh upload over PHOTO_UPLOAD_RESIZE_BYTES before it is stored."""
+        limit = settings.PHOTO_UPLOAD_RESIZE_BYTES
+        if not limit or getattr(self.image, '_committed', True) or self.image.size <= limit:
+            return
+        self.image = cap_original(self.image, self.image.name, settings.PHOTO_UPLOAD_MAX_EDGE,
+                                  quality=settings.PHOTO_UPLOAD_QUALITY)
+
+    def set_metadata(self, metadata):
+        """Copy image_utils.read_metadata() onto METADATA_FIELDS."""
+        for name in self.METADATA_FIELDS:
+            setattr(self, name, metadata[name])
+        if self.taken is not None and timezone.is_naive(self.taken):
+            # No OffsetTime in the EXIF: camera clock, read as TIME_ZONE.
+            self.taken = timezone.make_aware(self.taken)
+
+    def build_derivatives(self):
+        """
+        Decode the original once and (re)write every derivative size. The
+        new files are stored before the rows are swapped in one transaction,
+        so the photo keeps its old derivatives until the new ones are in;
+        the old files are deleted once that commits.
+        """
+        storage = self.thumbnail.storage
+        rendered = render_derivatives(self.image, self.image.name, settings.PHOTO_DERIVATIVE_SIZES,
+                                      mode=settings.PHOTO_RESIZE_MODE,
+                                      modern_formats=supported_modern_formats(settings.PHOTO_DERIVATIVE_FORMATS))
+        derivatives = []
         try:
-            # If the instance already exists, check if the thumbnail has changed
-            this = Photo.objects.get(id=self.id)
-            if this.thumbnail != self.thumbnail:
-                this.thumbnail.delete(save=False)  # Delete the old thumbnail
-        except Photo.DoesNotExist:
-            pass  # Instance doesn't exist, create a new thumbnail
-
-        if self.image:  # Only generate thumbnail if there's an image
-            img = Image.open(self.image)
-
-            # Handle EXIF orientation
-            if hasattr(img, '_getexif'):
-                exif = img._getexif()
-                if exif:
-                    orientation = None
-                    for tag, label in ExifTags.TAGS.items():
-                        if label == 'Orientation':
-                            orientation = tag
-                            break
-                    if orientation in exif:
-                        if exif[orientation] == 3:
-                            img = img.rotate(180, expand=True)
-                        elif exif[orientation] == 6:
-                            img = img.rotate(270, expand=True)
-                        elif exif[orientation] == 8:
-                            img = img.rotate(90, expand=True)
-
-            img.thumbnail((360, 360), Image.LANCZOS)  # LANCZOS for better quality
-            output = BytesIO()
-
-            # Determine the format for saving the thumbnail
-            image_format = self.image.name.split('.')[-1].lower()
-            if image_format in ('jpg', 'jpeg'):
-                file_extension = 'jpg'
-                format_type = 'JPEG'
-            elif image_format == 'png':
-                file_extension = 'png'
-                format_type = 'PNG'
-            elif image_format == 'webp':
-                file_extension = 'webp'
-                format_type = 'WEBP'
-            else:
-                file_extension = 'jpg'
-                format_type = 'JPEG'  # Default file type
+            for size, format_type, file_name, width, height, output in rendered.derivatives:
+                derivative = PhotoDerivative(photo=self, size=size, format=format_type, width=width, height=height)
+                derivative.image.save(file_name, File(output), save=False)
+                derivatives.append(derivative)
+
+            with transaction.atomic():
+                old_files = {d.image.name for d in self.derivatives.all()}
+                if self.thumbnail:
+                    old_files.add(self.thumbnail.name)
+                self.derivatives.all().delete()
+                PhotoDerivative.objects.bulk_create(derivatives)
+
+                # The smallest fallback doubles as the legacy thumbnail, without a second copy.
+                self.thumbnail.name = derivatives[0].image.name
+                self.derivatives_ready = True
+                self.dhash = rendered.dhash
+                self.set_metadata(rendered.metadata)
+                self.save(update_fields=['thumbnail', 'derivatives_ready', 'dhash', *self.METADATA_FIELDS])
+        except Exception:
+            for derivative in derivatives:
+                storage.delete(derivative.image.name)
+            raise
+
+        def delete_old_files():
+            for name in old_files - {d.image.name for d in derivatives}:
+                storage.delete(name)
+        transaction.on_commit(delete_old_files)
 
-            # Save the thumbnail to the buffer in the determined format
-            img.save(output, format=format_type, quality=95)
-            output.seek(0)
+    def _derivatives_by_format(self):
+        grouped = {}
+        if self.derivatives_ready:
+            for d in self.derivatives.all():
+                grouped.setdefault(d.format, []).append(d)
+        return grouped
+
+    def srcset(self):
+        fallback = self._derivatives_by_format().get(output_format(self.image.name)[1], [])
+        return ', '.join(f'{d.image.url} {d.width}w' for d in fallback)
+
+    def sources(self):
+        """[{'type': mime, 'srcset': ...}] for the modern formats, best first, for <picture>."""
+        grouped = self._derivatives_by_format()
+        fallback = output_format(self.image.name)[1]
+        return [
+            {'type': f'image/{fmt.lower()}',
+             'srcset': ', '.join(f'{d.image.url} {d.width}w' for d in grouped[fmt])}
+            for fmt in MODERN_FORMATS if fmt in grouped and fmt != fallback
+        ]
+
+    def display_url(self):
+        """Largest fallback derivative, or the original while derivatives are pending."""
+        fallback = self._derivatives_by_format().get(output_format(self.image.name)[1])
+        if fallback:
+            return fallback[-1].image.url
+        return self.image.url
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            # Counters, version and search_vector only change through atomic
+            # UPDATEs (photoapp.signals); a full save of an instance loaded
+            # earlier must not write stale values back over them.
+            skip = set(self.MAINTAINED_FIELDS) | self.get_deferred_fields()
+            kwargs['update_fields'] = [f.name for f in self._meta.concrete_fields
+                                       if not f.primary_key and f.name not in skip and f.attname not in skip]
 
-            # Create a Django File object from the buffer
-            thumbnail_file_name = f"{self.image.name.split('.')[0]}_thumbnail.{file_extension}"  # Add "_thumbnail" to the name
-            self.thumbnail = File(output, thumbnail_file_name)
+        # Only run the image pipeline when the original changed; edits that
+        # touch title/tags/year go straight to the database.
+        image_changed = self.image_changed()
+        if image_changed:
+            self.hash_original()
+            self.ingest_original()
+            # Until derivatives are rebuilt, templates fall back to the original.
+            self.derivatives_ready = False
 
         super().save(*args, **kwargs)
+        self._loaded_image_name = self._image_name()
+        self._loaded_year_id = self.year_id
+        self._loaded_dhash = self.__dict__.get('dhash')
+
+        if image_changed:
+            if settings.PHOTO_DERIVATIVES_ASYNC:
+                DerivativeJob.objects.filter(photo=self, status=DerivativeJob.PENDING).delete()
+                DerivativeJob.objects.create(photo=self)
+            else:
+                self.build_derivatives()
 
     def __str__(self):
         return self.title
 
 
+class PhotoDerivative(models.Model):
+    photo = models.ForeignKey(Photo, related_name='derivatives', on_delete=models.CASCADE)
+    size = models.PositiveSmallIntegerField()  # target long edge, from PHOTO_DERIVATIVE_SIZES
+    format = models.CharField(max_length=4)  # PIL format name: JPEG, PNG, WEBP or AVIF
+    image = models.ImageField(upload_to='derivatives/%Y%m')
+    width = models.PositiveSmallIntegerField()
+    height = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['size']
+        constraints = [
+            models.UniqueConstraint(fields=['photo', 'size', 'format'], name='unique_photo_derivative'),
+        ]
+
+    def __str__(self):
+        return f'{self.photo_id} @ {self.size}px {self.format}'
+
+
 class Comment(models.Model):
     photo = models.ForeignKey(Photo, related_name='comments', on_delete=models.CASCADE)
     submitter = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
@@ -139,5 +313,50 @@ class Favorite(models.Model):
     user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
     favorite = models.ForeignKey(Photo, related_name='favorite', on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'favorite'], name='unique_user_favorite'),
+        ]
+
     def __str__(self):
         return self.favorite.title
+
+
+class DerivativeJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    photo = models.ForeignKey(Photo, related_name='derivative_jobs', on_delete=models.CASCADE)
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['created', 'id']
+        indexes = [models.Index(fields=['status', 'created'])]
+
+    def __str__(self):
+        return f'{self.photo_id} ({self.status})'
+
+
+class CacheVersion(models.Model):
+    """
+    Version counters that cache keys embed (photoapp.cache_utils). Kept
+    here rather than in the cache: bumps are atomic UPDATEs, and culling
+    can't drop one and send it back to a version whose entries still exist.
+    """
+    key = models.CharField(max_length=64, primary_key=True)
+    value = models.PositiveBigIntegerField(default=1)
+
+    def __str__(self):
+        return f'{self.key} = {self.value}'
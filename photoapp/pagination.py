@@ -0,0 +1,132 @@
+# photoapp/pagination.py
+import base64
+import hashlib
+import json
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from .cache_utils import get_count_ver, get_or_compute, list_scope
+
+PAGE_SIZE = 24
+# Pages 1..NUMBERED_PAGES get numbered links (cheap OFFSETs); past that the
+# grid moves on with cursors so deep pages cost the same as the first.
+NUMBERED_PAGES = 10
+COUNT_TTL = 600
+
+# sort -> (key field, descending); `id` breaks ties so the order is total.
+KEYSET_ORDERINGS = {
+    '-created': ('created', True),
+    'created': ('created', False),
+    '-year__year': ('year__year', True),
+    'year__year': ('year__year', False),
+    '-taken_at': ('taken_at', True),  # queries.LIST_ANNOTATIONS
+    'taken_at': ('taken_at', False),
+}
+DATETIME_KEYS = {'created', 'taken_at'}
+
+
+def keyset_order(sort):
+    field, descending = KEYSET_ORDERINGS[sort]
+    return (f'-{field}', '-id') if descending else (field, 'id')
+
+
+def photo_count_key(search_m, search):
+    digest = hashlib.md5(f'{search_m}:{search}'.encode()).hexdigest()
+    return f'photo_count_v2:{list_scope(search_m)}:{get_count_ver(list_scope(search_m))}:{digest}'
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator whose COUNT(*) is cached under `count_key` (one per filter, not per sort)."""
+
+    def __init__(self, object_list, per_page, count_key, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+
+    @cached_property
+    def count(self):
+        return get_or_compute(self.count_key, self.object_list.count, COUNT_TTL)
+
+
+def _key_value(obj, field):
+    for part in field.split('__'):
+        obj = getattr(obj, part)
+    return obj
+
+
+def encode_cursor(obj, sort):
+    field, _ = KEYSET_ORDERINGS[sort]
+    value = _key_value(obj, field)
+    if field in DATETIME_KEYS:
+        value = value.isoformat()
+    raw = json.dumps([value, obj.pk], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    """(key value, id) from a cursor, or None if it is malformed."""
+    field, _ = KEYSET_ORDERINGS[sort]
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, pk = json.loads(raw)
+        pk = int(pk)
+        if field in DATETIME_KEYS:
+            value = parse_datetime(value)
+    except (ValueError, TypeError):
+        return None
+    if value is None:
+        return None
+    return value, pk
+
+
+class KeysetPage:
+    """One page of a cursor-paginated queryset; iterates like a Page."""
+
+    def __init__(self, object_list, sort, has_next, has_previous):
+        self.object_list = object_list
+        self.next_cursor = encode_cursor(object_list[-1], sort) if has_next and object_list else None
+        self.previous_cursor = encode_cursor(object_list[0], sort) if has_previous and object_list else None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def keyset_queryset(queryset, sort, cursor=None, backwards=False):
+    """
+    `queryset` ordered by `sort` (reversed if `backwards`) and, given a
+    decoded `cursor`, narrowed to the rows after it: a range scan on
+    (key, id) instead of an OFFSET.
+    """
+    field, descending = KEYSET_ORDERINGS[sort]
+    forward_desc = descending != backwards
+    qs = queryset.order_by(*((f'-{field}', '-id') if forward_desc else (field, 'id')))
+    if cursor is not None:
+        value, pk = cursor
+        op = 'lt' if forward_desc else 'gt'
+        qs = qs.filter(Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'id__{op}': pk}))
+    return qs
+
+
+def keyset_page(queryset, sort, after=None, before=None, per_page=PAGE_SIZE):
+    """The page following cursor `after` (or preceding `before`) in `sort` order, without a COUNT(*)."""
+    backwards = before is not None and after is None
+    cursor = decode_cursor(before if backwards else after, sort)
+    # Walking backwards reads the reversed order and flips the rows after.
+    rows = list(keyset_queryset(queryset, sort, cursor, backwards)[:per_page + 1])
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+        return KeysetPage(rows, sort, has_next=cursor is not None, has_previous=more)
+    return KeysetPage(rows, sort, has_next=more, has_previous=cursor is not None)
@@ -0,0 +1,99 @@
+# photoapp/queries.py
+from django.db.models import Q
+from django.db.models.functions import Coalesce
+
+from .models import Photo
+from .pagination import keyset_order
+from .search import search_filter
+
+# ?sort_by= value -> ordering of the grid (`id` is appended as a tiebreaker)
+SORTS = {
+    'createdasc': 'created',
+    'takendesc': '-taken_at',
+    'takenasc': 'taken_at',
+    'yeardesc': '-year__year',
+    'yearasc': 'year__year',
+}
+# The sort buttons above the grid, in order; no ?sort_by= is 'createddesc'.
+SORT_CHOICES = (
+    ('createddesc', 'Added ▼'),
+    ('createdasc', 'Added ▲'),
+    ('takendesc', 'Taken ▼'),
+    ('takenasc', 'Taken ▲'),
+    ('yeardesc', 'Year ▼'),
+    ('yearasc', 'Year ▲'),
+)
+
+# The "taken" sorts: EXIF capture time, or when it was added for photos
+# without one. Matches the photo_taken_idx expression index.
+LIST_ANNOTATIONS = {'taken_at': Coalesce('taken', 'created')}
+
+
+def photo_list_query(params):
+    """
+    The photo grid queryset for a request's GET params (one filter of
+    favorites/member/tag/year/person/search, plus sort_by). Returns
+    (queryset, sort, ranked, search_m, search); `ranked` means the rows
+    are in full-text rank order rather than `sort`.
+    """
+    sort_by = params.get('sort_by')
+    sort = SORTS.get(sort_by, '-created')
+    rank = None
+
+    base = (
+        Photo.objects
+        .select_related('year')
+        # Just what ordering, cursors and the tile cache keys need; tile
+        # content comes from photoapp.tiles.
+        .only('id', 'version', 'created', 'year__year')
+        .annotate(**LIST_ANNOTATIONS)
+        .order_by(*keyset_order(sort))
+    )
+
+    q = Q()
+    search = ''
+    search_m = None
+    needs_distinct = False  # only filters that can match a photo more than once
+
+    if params.get('favorites'):
+        first, *rest = params['favorites'].split()
+        last = ' '.join(rest) if rest else ''
+        q &= Q(favorite__user__first_name=first) & Q(favorite__user__last_name=last)
+        search = params['favorites']; search_m = 'favorites'
+        needs_distinct = True
+
+    elif params.get('member'):
+        first, *rest = params['member'].split()
+        last = ' '.join(rest) if rest else ''
+        q &= Q(submitter__first_name=first) & Q(submitter__last_name=last)
+        search = params['member']; search_m = 'member'
+
+    elif params.get('tag'):
+        q &= Q(tags__name=params['tag'])
+        search = params['tag']; search_m = 'tag'
+
+    elif params.get('year'):
+        q &= Q(year__year=params['year'])
+        search = params['year']; search_m = 'year'
+
+    elif params.get('person'):
+        q &= Q(people__name=params['person'])
+        search = params['person']; search_m = 'person'
+
+    elif params.get('search'):
+        terms = [t.strip() for t in params['search'].split(',') if t.strip()]
+        term_q, rank = search_filter(terms)
+        q &= term_q
+        search = params['search']; search_m = 'search'
+        # The tsvector lives on the photo row; only the icontains fallback joins tags.
+        needs_distinct = rank is None
+
+    photos_qs = base.filter(q)
+    if needs_distinct:
+        photos_qs = photos_qs.distinct()
+    # Only a sort the user picked from SORT_CHOICES overrides rank; a missing or stray
+    # ?sort_by= (an old link's "None") keeps best matches first on every page.
+    ranked = rank is not None and sort_by not in dict(SORT_CHOICES)
+    if ranked:
+        photos_qs = photos_qs.annotate(rank=rank).order_by('-rank', '-created')
+    return photos_qs, sort, ranked, search_m, search
@@ -0,0 +1,126 @@
+# photoapp/search.py
+import re
+from difflib import SequenceMatcher
+
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import F, OuterRef, Q, Subquery, TextField, Value
+from django.db.models.functions import Coalesce
+
+from .models import Photo, Year, GenericTag, PeopleTag, TaggedGeneric, TaggedPeople
+
+# Titles/descriptions are prose (stemmed, stop words dropped); tags, names
+# and years are matched as-is so e.g. "Will" or "May" survive.
+PROSE_CONFIG = 'english'
+NAME_CONFIG = 'simple'
+
+
+def full_text_enabled():
+    return connection.vendor == 'postgresql'
+
+
+def _names_subquery(through):
+    # Space-joined tag names for the outer photo, via the generic through table.
+    return Coalesce(Subquery(
+        through.objects
+        .filter(content_type=ContentType.objects.get_for_model(Photo), object_id=OuterRef('pk'))
+        .order_by()
+        .values('object_id')
+        .annotate(names=StringAgg('tag__name', ' '))
+        .values('names')
+    ), Value(''), output_field=TextField())
+
+
+def search_vector_expression():
+    year = Subquery(Year.objects.filter(pk=OuterRef('year_id')).order_by().values('year'))
+    return (SearchVector('title', weight='A', config=PROSE_CONFIG)
+            + SearchVector(_names_subquery(TaggedGeneric), _names_subquery(TaggedPeople),
+                           weight='A', config=NAME_CONFIG)
+            + SearchVector(year, weight='B', config=NAME_CONFIG)
+            + SearchVector('description', weight='C', config=PROSE_CONFIG))
+
+
+def update_search_vectors(photo_ids=None):
+    """Rebuild Photo.search_vector for `photo_ids` (all photos if None). PostgreSQL only."""
+    if not full_text_enabled():
+        return 0
+    photos = Photo.objects.all()
+    if photo_ids is not None:
+        photos = photos.filter(pk__in=photo_ids)
+    return photos.update(search_vector=search_vector_expression())
+
+
+def _term_query(term):
+    # Prefix-match every word of the term; words are reduced to \w+ so user
+    # input can't produce tsquery syntax errors.
+    words = re.findall(r'\w+', term)
+    if not words:
+        return None
+    raw = ' & '.join(f'{w}:*' for w in words)
+    return (SearchQuery(raw, search_type='raw', config=PROSE_CONFIG)
+            | SearchQuery(raw, search_type='raw', config=NAME_CONFIG))
+
+
+def search_filter(terms):
+    """
+    Return (Q, rank expression or None) matching photos where every
+    comma-separated term hits title, description, tags, people or year.
+    """
+    if not full_text_enabled():
+        q = Q()
+        for term in terms:
+            q &= (Q(title__icontains=term) |
+                  Q(tags__name__icontains=term) |
+                  Q(people__name__icontains=term) |
+                  Q(year__year__icontains=term))
+        return q, None
+
+    query = None
+    for term in terms:
+        term_query = _term_query(term)
+        if term_query is not None:
+            query = term_query if query is None else query & term_query
+    if query is None:
+        return Q(), None
+    return Q(search_vector=query), SearchRank(F('search_vector'), query)
+
+
+# --- tag/people autocomplete
+
+SUGGEST_MODELS = {
+    'tag': GenericTag,
+    'person': PeopleTag,
+}
+# Minimum score for the in-process fallback, roughly pg_trgm's default
+# word_similarity_threshold.
+FALLBACK_MIN_SCORE = 0.6
+
+
+def _fallback_score(text, name):
+    name = name.lower()
+    if name.startswith(text) or any(word.startswith(text) for word in name.split()):
+        return 1.0
+    if text in name:
+        return 0.9
+    return SequenceMatcher(None, text, name[:len(text) + 2]).ratio()
+
+
+def suggest_names(text, kind, limit=10):
+    """Top `limit` (name, similarity) pairs of `kind` ('tag' or 'person') for `text`."""
+    model = SUGGEST_MODELS[kind]
+    if full_text_enabled():
+        # `%>` (word similarity) is answered from the gin_trgm_ops index.
+        rows = (model.objects
+                .filter(name__trigram_word_similar=text)
+                .annotate(similarity=TrigramWordSimilarity(text, 'name'))
+                .order_by('-similarity', 'name')
+                .values_list('name', 'similarity')[:limit])
+        return list(rows)
+
+    text = text.lower()
+    scored = ((name, _fallback_score(text, name)) for name in model.objects.values_list('name', flat=True))
+    matches = [(name, score) for name, score in scored if score >= FALLBACK_MIN_SCORE]
+    matches.sort(key=lambda m: (-m[1], m[0]))
+    return matches[:limit]
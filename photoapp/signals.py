@@ -1,20 +1,181 @@
-from django.db.models.signals import post_save, post_delete
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
-from .models import Comment, Favorite
-from .cache_utils import bump_grid_ver
+from .models import Photo, Comment, Favorite, Year, GenericTag, PeopleTag, TaggedGeneric, TaggedPeople
+from .cache_utils import invalidate_member_counts
+from .counters import bump_photo_counter, bump_facet_counter
+from .search import update_search_vectors
+from . import invalidation
 
 @receiver(post_save, sender=Comment)
-def _comment_saved(sender, instance, **kwargs):
-    bump_grid_ver()
+def _comment_saved(sender, instance, created, **kwargs):
+    if created:
+        bump_photo_counter(instance.photo_id, 'comments_count', 1)
+    else:
+        invalidation.comment_edited(instance.photo_id)
 
 @receiver(post_delete, sender=Comment)
 def _comment_deleted(sender, instance, **kwargs):
-    bump_grid_ver()
+    bump_photo_counter(instance.photo_id, 'comments_count', -1)
 
 @receiver(post_save, sender=Favorite)
-def _favorite_saved(sender, instance, **kwargs):
-    bump_grid_ver()
+def _favorite_saved(sender, instance, created, **kwargs):
+    if created:
+        bump_photo_counter(instance.favorite_id, 'favorites_count', 1)
+        invalidate_member_counts()
+        invalidation.favorites_changed()
 
 @receiver(post_delete, sender=Favorite)
 def _favorite_deleted(sender, instance, **kwargs):
-    bump_grid_ver()
+    bump_photo_counter(instance.favorite_id, 'favorites_count', -1)
+    invalidate_member_counts()
+    invalidation.favorites_changed()
+
+# --- member list counts (accounts.views.member_list_view)
+
+@receiver(post_save, sender=Photo)
+def _photo_saved(sender, instance, created, **kwargs):
+    if created:
+        invalidate_member_counts()
+
+@receiver(post_delete, sender=Photo)
+def _photo_deleted(sender, instance, **kwargs):
+    invalidate_member_counts()
+
+@receiver(m2m_changed, sender=TaggedPeople)
+def _people_changed(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_member_counts()
+
+@receiver(post_save, sender=get_user_model())
+def _member_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Logins save last_login only; the list cares about new members and names.
+    if created or update_fields is None or {'first_name', 'last_name'} & set(update_fields):
+        invalidate_member_counts()
+        if not created:
+            invalidation.member_renamed(instance.pk)
+
+@receiver(post_delete, sender=get_user_model())
+def _member_deleted(sender, instance, **kwargs):
+    invalidate_member_counts()
+
+# --- full-text search document (photoapp.search)
+
+SEARCH_FIELDS = {'title', 'description', 'year'}
+
+@receiver(post_save, sender=Photo)
+def _photo_search_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or SEARCH_FIELDS & set(update_fields):
+        update_search_vectors([instance.pk])
+
+@receiver(m2m_changed, sender=TaggedGeneric)
+@receiver(m2m_changed, sender=TaggedPeople)
+def _photo_search_tags_changed(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear') and isinstance(instance, Photo):
+        update_search_vectors([instance.pk])
+
+@receiver(post_save, sender=GenericTag)
+@receiver(post_save, sender=PeopleTag)
+def _search_tag_saved(sender, instance, created, **kwargs):
+    if not created:  # a rename; the photos carrying it index the old name
+        through = TaggedGeneric if sender is GenericTag else TaggedPeople
+        update_search_vectors(through.objects.filter(tag=instance).values('object_id'))
+
+@receiver(post_save, sender=Year)
+def _search_year_saved(sender, instance, created, **kwargs):
+    if not created:  # a rename; its photos index the old year
+        update_search_vectors(Photo.objects.filter(year=instance).values('pk'))
+
+# --- facet counters (Year/GenericTag/PeopleTag.photo_count, photoapp.counters)
+
+FACET_TAG_MODELS = {TaggedGeneric: GenericTag, TaggedPeople: PeopleTag}
+
+@receiver(m2m_changed, sender=TaggedGeneric)
+@receiver(m2m_changed, sender=TaggedPeople)
+def _facet_tags_changed(sender, instance, action, pk_set, **kwargs):
+    if not isinstance(instance, Photo):
+        return
+    tag_model = FACET_TAG_MODELS[sender]
+    if action == 'pre_clear':
+        # taggit sends no pk_set on clear; note what is about to go.
+        cleared = sender.objects.filter(**sender.lookup_kwargs(instance)).values_list('tag_id', flat=True)
+        instance.__dict__.setdefault('_facet_cleared', {})[sender] = list(cleared)
+        return
+    if action == 'post_add':
+        bump_facet_counter(tag_model, pk_set, 1)  # pk_set holds only the newly added tags
+    elif action == 'post_remove':
+        bump_facet_counter(tag_model, pk_set, -1)
+    elif action == 'post_clear':
+        bump_facet_counter(tag_model, instance.__dict__.get('_facet_cleared', {}).pop(sender, []), -1)
+
+@receiver(post_save, sender=Photo)
+def _facet_photo_saved(sender, instance, created, **kwargs):
+    if created:
+        bump_facet_counter(Year, [instance.year_id], 1)
+    elif instance.year_id != instance._loaded_year_id:
+        bump_facet_counter(Year, [instance._loaded_year_id], -1)
+        bump_facet_counter(Year, [instance.year_id], 1)
+
+@receiver(pre_delete, sender=Photo)
+def _facet_photo_deleting(sender, instance, **kwargs):
+    # The through rows go in the same cascade, without m2m_changed.
+    instance._facet_deleting = {
+        through: list(through.objects.filter(**through.lookup_kwargs(instance)).values_list('tag_id', flat=True))
+        for through in FACET_TAG_MODELS
+    }
+
+@receiver(post_delete, sender=Photo)
+def _facet_photo_deleted(sender, instance, **kwargs):
+    bump_facet_counter(Year, [instance.year_id], -1)
+    for through, tag_ids in getattr(instance, '_facet_deleting', {}).items():
+        bump_facet_counter(FACET_TAG_MODELS[through], tag_ids, -1)
+
+# --- list cache invalidation (photoapp.invalidation)
+# Connected last so the counters above are current before caches are dropped.
+
+LIST_TEXT_FIELDS = {'title', 'description'}
+TAG_SCOPES = {TaggedGeneric: 'tag', TaggedPeople: 'person'}
+
+@receiver(post_save, sender=Photo)
+def _lists_photo_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        # Uploads get their dhash from build_derivatives, saved with update_fields below.
+        invalidation.photo_added_or_removed(fingerprinted=instance.dhash is not None)
+        return
+    invalidation.photo_edited(
+        instance.pk,
+        year_changed=instance.year_id != instance._loaded_year_id,
+        text_changed=update_fields is None or bool(LIST_TEXT_FIELDS & set(update_fields)),
+    )
+
+@receiver(post_delete, sender=Photo)
+def _lists_photo_deleted(sender, instance, **kwargs):
+    invalidation.photo_added_or_removed(fingerprinted=instance.dhash is not None)
+
+@receiver(post_save, sender=Photo)
+def _similar_photo_saved(sender, instance, created, update_fields=None, **kwargs):
+    # build_derivatives saves the new dhash with update_fields; full saves list it too, unchanged.
+    if (not created and update_fields is not None and 'dhash' in update_fields
+            and instance.dhash != instance._loaded_dhash):
+        invalidation.fingerprints_changed()
+
+@receiver(m2m_changed, sender=TaggedGeneric)
+@receiver(m2m_changed, sender=TaggedPeople)
+def _lists_tags_changed(sender, instance, action, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        # From the tag side pk_set holds photo ids (none on clear).
+        photo_ids = [instance.pk] if isinstance(instance, Photo) else list(pk_set or ())
+        invalidation.tags_changed(TAG_SCOPES[sender], photo_ids)
+
+@receiver(post_save, sender=Year)
+def _lists_year_saved(sender, instance, created, **kwargs):
+    if not created:
+        invalidation.year_renamed(instance.pk)
+
+@receiver(post_save, sender=GenericTag)
+@receiver(post_save, sender=PeopleTag)
+def _lists_tag_saved(sender, instance, created, **kwargs):
+    if not created:
+        through = TaggedGeneric if sender is GenericTag else TaggedPeople
+        photo_ids = list(through.objects.filter(tag=instance).values_list('object_id', flat=True))
+        invalidation.tag_renamed(TAG_SCOPES[through], photo_ids)
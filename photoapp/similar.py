@@ -0,0 +1,120 @@
+# photoapp/similar.py
+"""
+"Similar photos": neighbours by Hamming distance between Photo.dhash.
+
+Each process keeps every hash in memory in a multi-index hash table: the
+64 bits are cut into MAX_DISTANCE + 1 bands, and each band maps its
+values to the photos that have them. Two hashes at most MAX_DISTANCE
+bits apart agree on at least one band, so a lookup compares only the
+photos sharing a bucket with it instead of scanning the library. The
+table is rebuilt when the similar version moves
+(invalidation.fingerprints_changed): in a background thread, while
+requests keep reading the table they have, so a change in one process
+never stalls a request in another. Only a process's first lookup waits
+for a build. `manage.py bench_similar` times it.
+"""
+import threading
+from array import array
+
+from django.db import connection
+
+from .cache_utils import get_similar_ver
+from .image_utils import DHASH_MASK
+from .models import Photo
+
+MAX_DISTANCE = 8   # differing bits still shown as similar; 0 is the same picture
+SIMILAR_LIMIT = 8  # photos in the detail panel
+
+
+def _bands(bits, count):
+    """(shift, mask) of `count` bands splitting `bits` bits as evenly as possible."""
+    bands, shift = [], 0
+    for i in range(count):
+        width = bits // count + (i < bits % count)
+        bands.append((shift, (1 << width) - 1))
+        shift += width
+    return bands
+
+
+BANDS = _bands(DHASH_MASK.bit_length(), MAX_DISTANCE + 1)
+
+
+class HashIndex:
+    """In-memory neighbour lookup over (photo id, dhash) rows."""
+
+    def __init__(self, rows):
+        self.ids = array('q')
+        self.hashes = array('Q')
+        self.tables = [{} for _ in BANDS]
+        for pk, value in rows:
+            value &= DHASH_MASK
+            position = len(self.ids)
+            self.ids.append(pk)
+            self.hashes.append(value)
+            for table, (shift, mask) in zip(self.tables, BANDS):
+                table.setdefault((value >> shift) & mask, []).append(position)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def near(self, value, exclude=None):
+        """[(distance, photo id)] of the photos within MAX_DISTANCE bits of `value`, nearest first."""
+        value &= DHASH_MASK
+        seen = set()
+        found = []
+        for table, (shift, mask) in zip(self.tables, BANDS):
+            for position in table.get((value >> shift) & mask, ()):
+                if position in seen:
+                    continue
+                seen.add(position)
+                distance = (self.hashes[position] ^ value).bit_count()
+                if distance <= MAX_DISTANCE and self.ids[position] != exclude:
+                    found.append((distance, self.ids[position]))
+        found.sort()
+        return found
+
+
+_index = (None, None)  # (similar version, HashIndex) of this process
+_rebuilding = threading.Lock()
+
+
+def _build(version):
+    global _index
+    rows = Photo.objects.filter(dhash__isnull=False).values_list('id', 'dhash').iterator(chunk_size=5000)
+    _index = (version, HashIndex(rows))
+
+
+def _build_in_background(version):
+    try:
+        _build(version)
+    finally:
+        connection.close()  # this thread's own connection
+        _rebuilding.release()
+
+
+def similar_index():
+    version = get_similar_ver()
+    built, index = _index
+    if built is None:
+        with _rebuilding:
+            if _index[0] is None:
+                _build(version)
+        return _index[1]
+    if built != version and _rebuilding.acquire(blocking=False):
+        threading.Thread(target=_build_in_background, args=(version,), daemon=True).start()
+    return index
+
+
+def similar_ids(photo, limit=SIMILAR_LIMIT):
+    """Ids of the photos that look most like `photo`, nearest first."""
+    if photo.dhash is None:
+        return []
+    return [pk for _, pk in similar_index().near(photo.dhash, exclude=photo.pk)[:limit]]
+
+
+def similar_photos(photos, limit=SIMILAR_LIMIT):
+    """{photo id: [similar Photo, nearest first]} for `photos`, with one query for all of them."""
+    ids = {photo.pk: similar_ids(photo, limit) for photo in photos}
+    wanted = set().union(*ids.values())
+    found = Photo.objects.only('id', 'title', 'thumbnail').in_bulk(wanted) if wanted else {}
+    return {pk: [found[i] for i in similar if i in found] for pk, similar in ids.items()}
@@ -0,0 +1,50 @@
+# photoapp/tiles.py
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .models import Photo
+
+TILE_TTL = 60 * 60 * 24  # keys carry the version, so stale tiles are never read
+
+
+def tile_key(photo_id, version):
+    return f'photo_tile_v1:{photo_id}:{version}'
+
+
+def tile_queryset():
+    """Everything photoapp/tile.html touches, for the tiles missing from the cache."""
+    return (Photo.objects
+            .select_related('year', 'submitter')
+            .prefetch_related('derivatives')
+            .only('id', 'title', 'image', 'thumbnail', 'derivatives_ready', 'created', 'year__year',
+                  'comments_count', 'favorites_count', 'version',
+                  'submitter__first_name', 'submitter__last_name'))
+
+
+def tile_html(photos):
+    """
+    {photo id: tile HTML} for `photos` (anything with .pk and .version). One
+    cache.get_many for the page; only missing tiles are loaded and rendered.
+    Photos deleted since they were read are left out.
+    """
+    keys = {p.pk: tile_key(p.pk, p.version) for p in photos}
+    found = cache.get_many(keys.values())
+    missing = [pk for pk, key in keys.items() if key not in found]
+
+    html = {pk: mark_safe(found[key]) for pk, key in keys.items() if key in found}
+    if missing:
+        fresh = {}
+        for photo in tile_queryset().filter(pk__in=missing):
+            rendered = render_to_string('photoapp/tile.html', {'photo': photo})
+            html[photo.pk] = mark_safe(rendered)
+            # Keyed by the version just read, which may be newer than the page's.
+            fresh[tile_key(photo.pk, photo.version)] = rendered
+        cache.set_many(fresh, TILE_TTL)
+    return html
+
+
+def render_tiles(photos):
+    """Tile HTML for `photos`, in order."""
+    html = tile_html(photos)
+    return [html[p.pk] for p in photos if p.pk in html]
@@ -0,0 +1,58 @@
+# photoapp/uploads.py
+"""
+Content hashes of originals. The upload handlers (FILE_UPLOAD_HANDLERS)
+hash each file as its chunks stream in, so checking an upload against
+Photo.sha256 costs no second read. Nothing here imports models; the
+import/scan workers (photoapp.workers) use file_sha256 too.
+"""
+import hashlib
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+HASH_CHUNK = 1024 * 1024
+
+
+def file_sha256(fp):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fp.read(HASH_CHUNK), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def upload_sha256(upload):
+    """SHA-256 of an uploaded file: the one taken while it streamed in, else read it now."""
+    digest = getattr(upload, 'sha256', None)
+    if digest is None:
+        upload.seek(0)
+        digest = file_sha256(upload)
+        upload.seek(0)
+    return digest
+
+
+class HashingUploadMixin:
+    """Hashes the chunks this handler keeps and sets `sha256` on the file it returns."""
+
+    def new_file(self, *args, **kwargs):
+        # Before super(): the memory handler claims a file by raising StopFutureHandlers.
+        self._sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        passed_on = super().receive_data_chunk(raw_data, start)
+        if passed_on is None:  # kept by this handler, not handed to the next
+            self._sha256.update(raw_data)
+        return passed_on
+
+    def file_complete(self, file_size):
+        upload = super().file_complete(file_size)
+        if upload is not None:
+            upload.sha256 = self._sha256.hexdigest()
+        return upload
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
@@ -1,7 +1,9 @@
 from django.urls import path
 from .views import (
     photo_list_view,
+    photo_grid_api,
     photo_detail_view,
+    photo_detail_batch,
     PhotoCreateView,
     PhotoUpdateView,
     PhotoDeleteView,
@@ -9,13 +11,16 @@ from .views import (
     about_view,
     edit_comment,
     recent_activity,
+    autocomplete,
 )
 
 app_name = 'photo'
 
 urlpatterns = [
     path('', photo_list_view, name='list'),
+    path('api/grid/', photo_grid_api, name='grid_api'),
     path('<int:pk>/', photo_detail_view, name='detail'),
+    path('details/', photo_detail_batch, name='detail_batch'),
     path('create/', PhotoCreateView.as_view(), name='create'),
     path('<int:pk>/update/', PhotoUpdateView.as_view(), name='update'),
     path('<int:pk>/delete/', PhotoDeleteView.as_view(), name='delete'),
@@ -23,4 +28,5 @@ urlpatterns = [
     path('about/', about_view, name='about'),
     path('comment/<int:pk>/edit/', edit_comment, name='edit_comment'),
     path('activity/', recent_activity, name='activity'),
+    path('autocomplete/', autocomplete, name='autocomplete'),
 ]
@@ -3,124 +3,69 @@ from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
 from django.views.generic import CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.core.paginator import Paginator
-from django.db.models import Q, Count
 from .models import Photo, GenericTag, PeopleTag, Comment, Favorite
 from django.template.loader import render_to_string
-from django.conf import settings
-from django.core.cache import cache
 from django.views.decorators.http import require_POST
-from .cache_utils import get_grid_ver
+from .cache_utils import facet_key, get_or_compute, FACET_KINDS
+from .counters import facet_counts
+from .search import suggest_names, SUGGEST_MODELS
+from .queries import SORT_CHOICES, SORTS, photo_list_query
+from .tiles import render_tiles, tile_html
+from .detail import detail_context, detail_etag, detail_payload, detail_payloads, detail_photo, detail_photos
+from .pagination import (PAGE_SIZE, NUMBERED_PAGES, COUNT_TTL, CachedCountPaginator, encode_cursor,
+                         keyset_page, photo_count_key)
 from django.http import JsonResponse, HttpResponseForbidden, HttpResponseNotAllowed
-
-CACHE_KEY_FACETS = "facet_counts_v1"
+from django.urls import reverse
+from .conditional import add_validators, make_etag, member_state, not_modified
+from .uploads import upload_sha256
 
 
 def cached_counts():
-    data = cache.get(CACHE_KEY_FACETS)
-    if data is None:
-        tag_counts = (Photo.objects
-                      .values('tags__name')
-                      .annotate(num=Count('id'))
-                      .order_by('tags__name'))
-        people_counts = (Photo.objects
-                         .values('people__name')
-                         .annotate(num=Count('id'))
-                         .order_by('people__name'))
-        year_counts = (Photo.objects
-                       .values('year__year')
-                       .annotate(num=Count('id'))
-                       .order_by('-year__year'))
-
-        data = {
-            'tag':    {r['tags__name']: r['num'] for r in tag_counts   if r['tags__name']},
-            'people': {r['people__name']: r['num'] for r in people_counts if r['people__name']},
-            'year':   {r['year__year']: r['num'] for r in year_counts  if r['year__year']},
-        }
-        cache.set(CACHE_KEY_FACETS, data, 600)   # 10 minutes
-    return data
-
-
-def total_photos_cached(ttl=300):
-    key = "photo_total_count_v1"
-    n = cache.get(key)
-    if n is None:
-        n = Photo.objects.count()
-        cache.set(key, n, ttl)             # cache for 5 minutes
-    return n
-
-
-def invalidate_facet_cache():
-    cache.delete(CACHE_KEY_FACETS)
+    # One key per dropdown, so a tag change doesn't drop the year counts.
+    # Reads the maintained photo_count columns; no GROUP BY over photos.
+    return {
+        kind: get_or_compute(facet_key(kind), lambda kind=kind: facet_counts([kind])[kind], 600)  # 10 minutes
+        for kind in FACET_KINDS
+    }
+
+
+def total_photos_cached():
+    # Same versioned key the unfiltered grid's paginator uses.
+    return get_or_compute(photo_count_key(None, ''), Photo.objects.count, COUNT_TTL)
 
 
 @login_required
 def photo_list_view(request):
-    # --- sort
+    photos_qs, sort, ranked, search_m, search = photo_list_query(request.GET)
     sort_by = request.GET.get('sort_by')
-    sort = {
-        'createdasc': 'created',
-        'yeardesc': '-year__year',
-        'yearasc': 'year__year',
-    }.get(sort_by, '-created')
-
-    base = (
-        Photo.objects
-        .select_related('year', 'submitter')
-        .only('id', 'title', 'thumbnail', 'created', 'year__year',
-              'submitter__first_name', 'submitter__last_name')
-        .annotate(
-            comments_count=Count('comments', distinct=True),
-            favorites_count=Count('favorite', distinct=True),
-        )
-        .order_by(sort)
-    )
-
-    q = Q()
-    search = ''
-    search_m = None
-
-    if request.GET.get('favorites'):
-        first, *rest = request.GET['favorites'].split()
-        last = ' '.join(rest) if rest else ''
-        q &= Q(favorite__user__first_name=first) & Q(favorite__user__last_name=last)
-        search = request.GET['favorites']; search_m = 'favorites'
-
-    elif request.GET.get('member'):
-        first, *rest = request.GET['member'].split()
-        last = ' '.join(rest) if rest else ''
-        q &= Q(submitter__first_name=first) & Q(submitter__last_name=last)
-        search = request.GET['member']; search_m = 'member'
-
-    elif request.GET.get('tag'):
-        q &= Q(tags__name=request.GET['tag'])
-        search = request.GET['tag']; search_m = 'tag'
-
-    elif request.GET.get('year'):
-        q &= Q(year__year=request.GET['year'])
-        search = request.GET['year']; search_m = 'year'
-
-    elif request.GET.get('person'):
-        q &= Q(people__name=request.GET['person'])
-        search = request.GET['person']; search_m = 'person'
-
-    elif request.GET.get('search'):
-        terms = [t.strip() for t in request.GET['search'].split(',') if t.strip()]
-        for term in terms:
-            q &= (Q(title__icontains=term) |
-                  Q(tags__name__icontains=term) |
-                  Q(people__name__icontains=term) |
-                  Q(year__year__icontains=term))
-        search = request.GET['search']; search_m = 'search'
-
-    photos_qs = base.filter(q).distinct()
 
     # --- pagination
-    paginator = Paginator(photos_qs, 24)
-    page_number = request.GET.get('page') or 1
-    photos = paginator.get_page(page_number)
-    photos.adjusted_elided_pages = paginator.get_elided_page_range(page_number)
-    page_links = list(paginator.get_elided_page_range(number=photos.number))
+    paginator = CachedCountPaginator(photos_qs, PAGE_SIZE, count_key=photo_count_key(search_m, search))
+    after, before = request.GET.get('after'), request.GET.get('before')
+    next_cursor = previous_cursor = None
+    cursor_mode = bool(after or before) and not ranked
+    if cursor_mode:
+        # Deep pages: seek past the cursor instead of OFFSET-scanning to it.
+        photos = keyset_page(photos_qs, sort, after=after, before=before, per_page=PAGE_SIZE)
+        page_links = []
+        next_cursor, previous_cursor = photos.next_cursor, photos.previous_cursor
+    else:
+        page_number = request.GET.get('page') or 1
+        photos = paginator.get_page(page_number)
+        page_links = [n for n in paginator.get_elided_page_range(number=photos.number)
+                      if n == paginator.ELLIPSIS or n <= max(NUMBERED_PAGES, photos.number)]
+        while page_links and page_links[-1] == paginator.ELLIPSIS:
+            page_links.pop()
+        if not ranked and photos.has_next() and photos.next_page_number() not in page_links:
+            next_cursor = encode_cursor(photos[len(photos) - 1], sort)
+
+    # Where infinite scroll picks up after the last tile on this page.
+    grid_next_url = None
+    if photos.has_next():
+        if ranked:
+            grid_next_url = grid_api_url(request.GET, page=photos.number + 1)
+        else:
+            grid_next_url = grid_api_url(request.GET, after=encode_cursor(list(photos)[-1], sort))
 
     # --- message
     if search:
@@ -134,28 +79,104 @@ def photo_list_view(request):
         message = 'Team Us Photos'
 
     facets = cached_counts()
+    total_photos_all = total_photos_cached()
+
+    # Everything the page shows besides the tile bodies, whose versions stand in for them.
+    etag = make_etag('list', request.get_full_path(), [(p.pk, p.version) for p in photos], paginator.count,
+                     total_photos_all, facets, member_state(request))
+    response = not_modified(request, etag)
+    if response is not None:
+        return add_validators(response, etag)
 
     context = {
         'message': message,
         'photos': photos,
         'total_photos': paginator.count,
-        'total_photos_all': total_photos_cached(),
+        'total_photos_all': total_photos_all,
         'page_links': page_links,
+        'tiles': render_tiles(list(photos)),
+        'cursor_mode': cursor_mode,
+        'next_cursor': next_cursor,
+        'previous_cursor': previous_cursor,
+        'grid_next_url': grid_next_url,
         'search': search,
         'search_m': search_m,
         'sort': sort_by,
+        'sort_choices': SORT_CHOICES,
+        'active_sort': sort_by if sort_by in SORTS else 'createddesc',
         'tag_list': facets['tag'],
         'people_list': facets['people'],
         'year_list': facets['year'],
-        'grid_ver': get_grid_ver(),
     }
-    return render(request, 'photoapp/list.html', context)
+    return add_validators(render(request, 'photoapp/list.html', context), etag)
+
+
+# Grid API rows: the list query's ordering fields plus what each tile's JSON shows.
+GRID_API_FIELDS = ('id', 'version', 'created', 'year__year', 'title', 'image', 'thumbnail',
+                   'derivatives_ready', 'comments_count', 'favorites_count')
+
+
+def grid_api_url(params, **position):
+    """photo:grid_api URL for the filter/sort in `params`, at `position` (after=<cursor> or page=<n>)."""
+    query = params.copy()
+    for key in ('after', 'before', 'page'):
+        query.pop(key, None)
+    query.update(position)
+    return f"{reverse('photo:grid_api')}?{query.urlencode()}"
+
+
+@login_required
+def photo_grid_api(request):
+    """
+    One page of grid tiles as JSON, for the same filters and sorts as
+    photo_list_view, without the facet dropdowns. Pages are walked with
+    `next` (a cursor; page numbers for rank-ordered search). The ETag
+    covers the page's photo ids and versions, so an unchanged page is
+    answered with a 304 before any tile is rendered.
+    """
+    photos_qs, sort, ranked, _, _ = photo_list_query(request.GET)
+    photos_qs = photos_qs.only(*GRID_API_FIELDS)
+    if ranked:
+        try:
+            page = max(1, int(request.GET.get('page', 1)))
+        except ValueError:
+            page = 1
+        rows = list(photos_qs[(page - 1) * PAGE_SIZE:page * PAGE_SIZE + 1])
+        next_url = grid_api_url(request.GET, page=page + 1) if len(rows) > PAGE_SIZE else None
+        rows = rows[:PAGE_SIZE]
+    else:
+        page = keyset_page(photos_qs, sort, after=request.GET.get('after'), per_page=PAGE_SIZE)
+        rows = page.object_list
+        next_url = grid_api_url(request.GET, after=page.next_cursor) if page.has_next() else None
+
+    etag = make_etag('grid', [(p.pk, p.version) for p in rows], next_url)
+    response = not_modified(request, etag)
+    if response is None:
+        tiles = tile_html(rows)
+        response = JsonResponse({
+            'results': [
+                {
+                    'id': photo.id,
+                    'url': reverse('photo:detail', args=[photo.id]),
+                    'title': photo.title,
+                    'thumbnail': (photo.thumbnail if photo.derivatives_ready and photo.thumbnail
+                                  else photo.image).url,
+                    'year': photo.year.year,
+                    'comments_count': photo.comments_count,
+                    'favorites_count': photo.favorites_count,
+                    'html': tiles[photo.pk],
+                }
+                for photo in rows if photo.pk in tiles
+            ],
+            'next': next_url,
+        })
+    return add_validators(response, etag)
 
 
 @login_required
 def photo_detail_view(request, pk):
-    photo = get_object_or_404(Photo, id=pk)
-    is_favorite = Favorite.objects.filter(user=request.user, favorite=photo).exists()
+    photo = detail_photo(pk)
+    is_favorite = None
 
     if request.method == 'POST':
         if request.POST.get('add') == 'add':
@@ -171,39 +192,34 @@ def photo_detail_view(request, pk):
                 text=request.POST.get('text', '').strip()
             )
 
-    # Recompute AFTER any change
-    favorites_qs = Favorite.objects.select_related('user').filter(favorite=photo)
-    favorites_count = favorites_qs.count()
-    comments_qs = photo.comments.all()
-    comments_count = comments_qs.count()
+        # Counters (and the version) were bumped in the database by the signals
+        photo.refresh_from_db(fields=['comments_count', 'favorites_count', 'version'])
 
-    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        html = render_to_string('photoapp/detail_modal.html', {
-            'photo': photo,
-            'is_favorite': is_favorite,
-            'favorites': favorites_qs,          # ok here
-            'favorites_count': favorites_count,
-            'comments': comments_qs,            # ok here
-            'MEDIA_URL': settings.MEDIA_URL,
-            'user': request.user,
-        }, request=request)
-
-        return JsonResponse({
-            'html': html,
-            'photo_id': photo.id,
-            'is_favorite': is_favorite,
-            'favorites_count': favorites_count,
-            'comments_count': comments_count,
-        })
+    ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    etag = detail_etag(request, photo, ajax)
+    response = not_modified(request, etag)
+    if response is None and ajax:
+        response = JsonResponse(detail_payload(request, photo, is_favorite))
+    elif response is None:
+        # Non-AJAX fallback render
+        response = render(request, 'photoapp/detail.html', detail_context(photo, request.user, is_favorite))
+    return add_validators(response, etag, vary=['X-Requested-With'])
+
+
+# Most photos one batch prefetch may ask for: two grid pages.
+DETAIL_BATCH_MAX = 2 * PAGE_SIZE
 
-    # Non-AJAX fallback render
-    return render(request, 'photoapp/detail.html', {
-        'photo': photo,
-        'is_favorite': is_favorite,
-        'favorites': favorites_qs,
-        'favorites_count': favorites_count,
-        'comments': comments_qs,
-    })
+
+@login_required
+def photo_detail_batch(request):
+    """
+    Modal payloads for ?ids=1,2,3 in one response, {"photos": {id: payload}},
+    so the modal can prefetch its neighbours with one request. Ids that no
+    longer exist are left out.
+    """
+    ids = [int(i) for i in request.GET.get('ids', '').split(',') if i.strip().isdigit()]
+    photos = detail_photos(list(dict.fromkeys(ids))[:DETAIL_BATCH_MAX])
+    return JsonResponse({'photos': detail_payloads(request, photos)})
 
 
 class PhotoCreateView(LoginRequiredMixin, CreateView):
@@ -213,12 +229,20 @@ class PhotoCreateView(LoginRequiredMixin, CreateView):
     success_url = '/photo/?page=1'
     extra_context = {'tags':GenericTag.objects.all().order_by('name'),'people':PeopleTag.objects.all().order_by('name'),}
 
+    duplicate = None
+
     def form_valid(self, form):
-        form.instance.thumbnail = self.request.FILES['image']
+        # Same bytes as a photo we already have: point at it instead of storing a copy.
+        digest = upload_sha256(form.cleaned_data['image'])
+        self.duplicate = Photo.objects.filter(sha256=digest).order_by('id').first()
+        if self.duplicate is not None:
+            form.add_error('image', 'This photo has already been added.')
+            return self.form_invalid(form)
         form.instance.submitter = self.request.user
-        res = super().form_valid(form)
-        invalidate_facet_cache()
-        return res
+        return super().form_valid(form)
+
+    def get_context_data(self, **kwargs):
+        return super().get_context_data(duplicate=self.duplicate, **kwargs)
 
 
 class UserIsSubmitter(UserPassesTestMixin):
@@ -242,50 +266,24 @@ class PhotoUpdateView(LoginRequiredMixin, UpdateView):
 
     def form_valid(self, form):
         form.instance.edited_by = self.request.user
-        res = super().form_valid(form)
-        invalidate_facet_cache()
-        return res
+        return super().form_valid(form)
 
 
 class PhotoDeleteView(UserIsSubmitter, DeleteView):
     template_name = 'photoapp/delete.html'
     model = Photo
     success_url = '/photo/?page=1'
-    invalidate_facet_cache()
 
 
 @require_POST
 @login_required
 def delete_comment(request, pk):
     comment = get_object_or_404(Comment, pk=pk)
-    photo = comment.photo
-
     comment.delete()
-
-    favorites_qs = Favorite.objects.select_related('user').filter(favorite=photo)
-    favorites_count = favorites_qs.count()
-    comments_qs = photo.comments.all()
-    comments_count = comments_qs.count()
-    is_favorite = Favorite.objects.filter(user=request.user, favorite=photo).exists()
+    photo = detail_photo(comment.photo_id)
 
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        html = render_to_string('photoapp/detail_modal.html', {
-            'photo': photo,
-            'is_favorite': is_favorite,
-            'favorites': favorites_qs,
-            'favorites_count': favorites_count,
-            'comments': comments_qs,
-            'MEDIA_URL': settings.MEDIA_URL,
-            'user': request.user,
-        }, request=request)
-
-        return JsonResponse({
-            'html': html,
-            'photo_id': photo.id,
-            'is_favorite': is_favorite,
-            'favorites_count': favorites_count,
-            'comments_count': comments_count,
-        })
+        return JsonResponse(detail_payload(request, photo))
 
     # Non-AJAX: go to regular detail page
     return redirect('photo:detail', pk=photo.pk)
@@ -303,31 +301,10 @@ def edit_comment(request, pk):
         c.text = new_text
         c.save()
 
-    photo = c.photo
-    is_favorite = Favorite.objects.filter(user=request.user, favorite=photo).exists()
-    favorites_count = Favorite.objects.filter(favorite=photo).count()
-    comments_qs = photo.comments.all()
-    comments_count = comments_qs.count()
-
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        html = render_to_string('photoapp/detail_modal.html', {
-            'photo': photo,
-            'is_favorite': is_favorite,
-            'favorites': Favorite.objects.select_related('user').filter(favorite=photo),
-            'favorites_count': favorites_count,
-            'comments': comments_qs,
-            'MEDIA_URL': settings.MEDIA_URL,
-            'user': request.user,
-        }, request=request)
-        return JsonResponse({
-            'html': html,
-            'photo_id': photo.id,
-            'is_favorite': is_favorite,
-            'favorites_count': favorites_count,
-            'comments_count': comments_count,
-        })
+        return JsonResponse(detail_payload(request, detail_photo(c.photo_id)))
 
-    return redirect('photo:detail', pk=photo.id)
+    return redirect('photo:detail', pk=c.photo_id)
 
 
 @login_required
@@ -353,6 +330,25 @@ def recent_activity(request):
 
 
 
+@login_required
+def autocomplete(request):
+    """Typeahead: ?q=<partial name>[&kind=tag|person][&limit=n] -> best matches first."""
+    text = (request.GET.get('q') or '').strip()
+    kinds = [request.GET['kind']] if request.GET.get('kind') in SUGGEST_MODELS else list(SUGGEST_MODELS)
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), 25))
+    except ValueError:
+        limit = 10
+
+    results = []
+    if text:
+        for kind in kinds:
+            results += [{'name': name, 'kind': kind, 'similarity': round(similarity, 3)}
+                        for name, similarity in suggest_names(text, kind, limit)]
+        results.sort(key=lambda r: -r['similarity'])
+    return JsonResponse({'q': text, 'results': results[:limit]})
+
+
 @login_required
 def about_view(request):
     return render(request, 'photoapp/about.html')
@@ -0,0 +1,133 @@
+# photoapp/workers.py
+"""
+The per-photo halves of `manage.py import_photos`, `rebuild_thumbnails` and
+`find_duplicates`, run in worker processes. Nothing here imports models: a
+spawned worker unpickles these functions before Django is set up.
+"""
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+from .image_utils import cap_original, render_derivatives, supported_modern_formats
+from .uploads import file_sha256
+
+_upload_to = {}
+_skip_hashes = frozenset()
+
+
+def init_worker(upload_to, skip_hashes=()):
+    """`upload_to`: {'image': ..., 'derivative': ...}, the strftime dirs of the model fields."""
+    global _upload_to, _skip_hashes
+    _upload_to = upload_to
+    _skip_hashes = frozenset(skip_hashes)
+    if not apps.ready:  # spawned rather than forked
+        django.setup()
+
+
+def worker_pool(workers, upload_to, skip_hashes=()):
+    """
+    A pool of `workers` processes set up by init_worker. They are spawned,
+    not forked: the parent holds a database connection, and often an open
+    .iterator() cursor on it, that a forked child would share.
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=init_worker, initargs=(upload_to, skip_hashes))
+
+
+def bounded_map(pool, fn, items, window, arg=None):
+    """
+    Yield (item, fn(arg(item))) in the order of `items`, with at most
+    `window` submitted to `pool` at a time, so a long stream of items is
+    never queued (or held in memory) all at once.
+    """
+    pending = deque()
+    for item in items:
+        pending.append((item, pool.submit(fn, arg(item) if arg else item)))
+        if len(pending) >= window:
+            item, future = pending.popleft()
+            yield item, future.result()
+    while pending:
+        item, future = pending.popleft()
+        yield item, future.result()
+
+
+def _store(kind, name, content):
+    directory = datetime.now().strftime(_upload_to[kind])
+    return default_storage.save(default_storage.generate_filename(f'{directory}/{name}'), content)
+
+
+def _render(fp, name):
+    return render_derivatives(fp, name, settings.PHOTO_DERIVATIVE_SIZES, mode=settings.PHOTO_RESIZE_MODE,
+                              modern_formats=supported_modern_formats(settings.PHOTO_DERIVATIVE_FORMATS))
+
+
+def _store_derivatives(rendered):
+    return [(size, format_type, _store('derivative', file_name, File(output)), width, height)
+            for size, format_type, file_name, width, height, output in rendered.derivatives]
+
+
+def process_file(path):
+    """
+    Hash `path` and, unless the hash is on the skip list, store the original
+    (capped like an upload) and its derivatives. Returns {'sha256', and
+    'skipped', 'error' or 'image' + 'derivatives' [(size, format, name,
+    width, height)] + 'dhash' + 'metadata'}.
+    """
+    try:
+        with open(path, 'rb') as fp:
+            digest = file_sha256(fp)
+            if digest in _skip_hashes:
+                return {'sha256': digest, 'skipped': True}
+
+            fp.seek(0)
+            name = os.path.basename(path)
+            original = File(fp, name=name)
+            limit = settings.PHOTO_UPLOAD_RESIZE_BYTES
+            if limit and os.fstat(fp.fileno()).st_size > limit:
+                original = cap_original(fp, name, settings.PHOTO_UPLOAD_MAX_EDGE,
+                                        quality=settings.PHOTO_UPLOAD_QUALITY)
+            image_name = _store('image', original.name, original)
+            original.seek(0)
+            rendered = _render(original, image_name)
+
+        return {'sha256': digest, 'image': image_name, 'derivatives': _store_derivatives(rendered),
+                'dhash': rendered.dhash, 'metadata': rendered.metadata}
+    except Exception as exc:
+        return {'sha256': None, 'error': f'{type(exc).__name__}: {exc}'}
+
+
+def rebuild_file(task):
+    """
+    Re-render the derivatives of (photo id, original name, dry run).
+    Returns {'id', 'bytes' (encoded size), and 'error' or 'dhash',
+    'metadata' and, unless dry run, 'derivatives' as process_file}.
+    """
+    photo_id, image_name, dry_run = task
+    try:
+        with default_storage.open(image_name) as fp:
+            rendered = _render(fp, image_name)
+        result = {'id': photo_id, 'bytes': sum(output.getbuffer().nbytes for *_, output in rendered.derivatives),
+                  'dhash': rendered.dhash, 'metadata': rendered.metadata}
+        if not dry_run:
+            result['derivatives'] = _store_derivatives(rendered)
+        return result
+    except Exception as exc:
+        return {'id': photo_id, 'error': f'{type(exc).__name__}: {exc}'}
+
+
+def hash_stored(task):
+    """SHA-256 of a stored original, for (photo id, name). Returns {'id', and 'sha256' or 'error'}."""
+    photo_id, image_name = task
+    try:
+        with default_storage.open(image_name) as fp:
+            return {'id': photo_id, 'sha256': file_sha256(fp)}
+    except Exception as exc:
+        return {'id': photo_id, 'error': f'{type(exc).__name__}: {exc}'}
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 BASE_DIR = Path(__file__).resolve().parent.parent  # .../photosmith/photosmith
 
@@ -66,6 +67,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'import_export',
     # 'taggit',
     'crispy_forms',
@@ -136,6 +138,41 @@ DATABASES = {
 }
 
 
+# Cache
+# Shared by every worker process:
+#   db     - a table in the database above, shared across hosts (the default;
+#            the photoapp migrations create it)
+#   redis  - a Redis server at CACHE_LOCATION (needs the redis package)
+#   file   - one file per key under CACHE_LOCATION, per host. Its add() isn't
+#            atomic, so cache_utils.get_or_compute's lock is best effort, and
+#            every write lists the directory to cull it.
+#   locmem - per-process memory, for development only
+# Photo grid tiles are cached one per photo, hence the high MAX_ENTRIES. The
+# version counters in the keys live in photoapp.CacheVersion, out of reach
+# of culling.
+
+CACHE_BACKEND = config('CACHE_BACKEND', default='db')
+CACHE_BACKENDS = {
+    'db': ('django.core.cache.backends.db.DatabaseCache', 'photosmith_cache'),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache',
+             os.path.join(tempfile.gettempdir(), 'photosmith_cache')),
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'photosmith'),
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': config('CACHE_LOCATION', default=CACHE_BACKENDS[CACHE_BACKEND][1]),
+        'TIMEOUT': 600,
+        'OPTIONS': {
+            'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=20000, cast=int),
+            'CULL_FREQUENCY': 4,
+        },
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -185,6 +222,30 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media/'
 
+# Photo derivatives (thumbnails etc.)
+# When async, uploads only store the original and `manage.py derivative_worker`
+# builds the derivatives from the DerivativeJob queue.
+PHOTO_DERIVATIVES_ASYNC = config('PHOTO_DERIVATIVES_ASYNC', default=True, cast=bool)
+PHOTO_DERIVATIVE_MAX_ATTEMPTS = 3
+# Long-edge sizes (px) rendered from a single decode; the smallest is the grid thumbnail.
+PHOTO_DERIVATIVE_SIZES = (360, 720, 1280, 2048)
+# Modern formats written next to each size (skipped if Pillow can't encode them).
+PHOTO_DERIVATIVE_FORMATS = ('avif', 'webp')
+# 'quality' decodes JPEGs with 1.25x headroom over the largest size; 'speed' decodes
+# at the smallest scale that still covers it. See `manage.py bench_thumbnails`.
+PHOTO_RESIZE_MODE = config('PHOTO_RESIZE_MODE', default='quality')
+# Uploads larger than this are re-encoded with the long edge capped before
+# they are stored (set to 0 to keep originals untouched).
+PHOTO_UPLOAD_RESIZE_BYTES = config('PHOTO_UPLOAD_RESIZE_BYTES', default=5 * 1024 * 1024, cast=int)
+PHOTO_UPLOAD_MAX_EDGE = config('PHOTO_UPLOAD_MAX_EDGE', default=4096, cast=int)
+PHOTO_UPLOAD_QUALITY = 90
+# Django's two handlers, plus a SHA-256 of each file taken as it streams in
+# (Photo.sha256, the duplicate check on upload).
+FILE_UPLOAD_HANDLERS = [
+    'photoapp.uploads.HashingMemoryFileUploadHandler',
+    'photoapp.uploads.HashingTemporaryFileUploadHandler',
+]
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
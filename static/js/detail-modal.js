@@ -14,6 +14,10 @@
   const SWAP_SELECTOR  = '.js-modal-swap';     // inner swappable area (inside .modal-body)
   const PREV_ID        = 'photoPrevBtn';
   const NEXT_ID        = 'photoNextBtn';
+  const GRID_SELECTOR     = '.js-photo-grid';      // tile container; data-next-url = grid API page
+  const SENTINEL_SELECTOR = '.js-grid-sentinel';   // just below the grid
+  const PAGER_SELECTOR    = '.js-grid-pager';      // page links superseded by infinite scroll
+  const SIMILAR_SELECTOR  = '.js-similar-photo';   // "Similar photos" links in the modal
 
   // =========================
   // State
@@ -84,12 +88,16 @@
   // =========================
   // Fetch utilities
   // =========================
-  async function fetchJSON(url, { signal } = {}) {
+  // With `etag`, the request is conditional and resolves to null on 304
+  async function fetchJSON(url, { signal, etag } = {}) {
+    const headers = { 'X-Requested-With': 'XMLHttpRequest' };
+    if (etag) headers['If-None-Match'] = etag;
     const res = await fetch(url, {
-      headers: { 'X-Requested-With': 'XMLHttpRequest' },
+      headers,
       credentials: 'same-origin',
       signal
     });
+    if (etag && res.status === 304) return null;
     const ct = (res.headers.get('content-type') || '').toLowerCase();
     if (!res.ok) {
       const text = await res.text().catch(() => '');
@@ -102,10 +110,11 @@
     return res.json();
   }
 
-  async function fetchDetailHTML(url, { signal } = {}) {
-    const data = await fetchJSON(url, { signal });
+  async function fetchDetailHTML(url, { signal, etag } = {}) {
+    const data = await fetchJSON(url, { signal, etag });
+    if (data === null) return null; // 304: the caller's copy is current
     if (!data || typeof data.html !== 'string') throw new Error('Response missing "html"');
-    return data; // { html, photo_id?, comments_count?, favorites_count?, ... }
+    return data; // { html, photo_id?, comments_count?, favorites_count?, etag?, ... }
   }
 
   async function postForm(url, formEl) {
@@ -136,33 +145,72 @@
   // =========================
   // Cache helpers / preload
   // =========================
-  function preloadImage(src) {
+  // Accepts a URL or an <img>; for an <img> the browser picks from its srcset
+  function preloadImage(srcOrImg) {
     return new Promise(resolve => {
-      if (!src) return resolve();
+      if (!srcOrImg) return resolve();
       const i = new Image();
       i.onload = i.onerror = resolve;
-      i.src = src;
+      if (typeof srcOrImg === 'string') {
+        i.src = srcOrImg;
+        return;
+      }
+      // Inside <picture> the <source> types drive the choice, so wait on the
+      // parsed element itself (it starts loading as soon as it's created).
+      if (srcOrImg.parentElement?.tagName === 'PICTURE') {
+        if (srcOrImg.complete) return resolve();
+        srcOrImg.addEventListener('load', resolve, { once: true });
+        srcOrImg.addEventListener('error', resolve, { once: true });
+        return;
+      }
+      if (srcOrImg.sizes) i.sizes = srcOrImg.sizes;
+      if (srcOrImg.srcset) i.srcset = srcOrImg.srcset;
+      if (srcOrImg.getAttribute('src')) i.src = srcOrImg.getAttribute('src');
+      else resolve();
     });
   }
 
+  // Prefetch the payloads of the photos around idx in one batch request
+  // (photo:detail_batch), then warm the images of the immediate neighbours.
+  const PREFETCH_RADIUS = 6;
+  const BATCH_URL = '/photo/details/';
+  const inflight = new Set();
+
   function preloadAround(idx) {
     if (!order.length) return;
-    const ids = [
+    const ids = [];
+    for (let d = 1; d <= PREFETCH_RADIUS && d < order.length; d++) {
+      [order[(idx + d) % order.length], order[(idx - d + order.length) % order.length]].forEach(pid => {
+        if (!htmlCache.has(pid) && !inflight.has(pid) && !ids.includes(pid)) ids.push(pid);
+      });
+    }
+    const neighbours = [
       order[(idx + 1) % order.length],
       order[(idx - 1 + order.length) % order.length]
     ];
-    ids.forEach(async (pid) => {
-      const url = idToUrl.get(pid);
-      if (!url || htmlCache.has(pid)) return;
-      try {
-        const data = await fetchDetailHTML(url);
-        htmlCache.set(pid, data);
-        const tmp = document.createElement('div');
-        tmp.innerHTML = data.html;
-        const img = tmp.querySelector(`${SWAP_SELECTOR} img`);
-        if (img?.src) preloadImage(img.src);
-      } catch { /* ignore preload errors */ }
+    const warmImages = () => neighbours.forEach(pid => {
+      const data = htmlCache.get(pid);
+      if (!data || data.imageWarmed) return;
+      data.imageWarmed = true;
+      const tmp = document.createElement('div');
+      tmp.innerHTML = data.html;
+      const img = tmp.querySelector(`${SWAP_SELECTOR} img`);
+      if (img?.src) preloadImage(img);
     });
+    if (!ids.length) return warmImages();
+
+    ids.forEach(pid => inflight.add(pid));
+    fetchJSON(`${BATCH_URL}?ids=${ids.join(',')}`)
+      .then(data => {
+        const now = Date.now();
+        Object.entries(data.photos || {}).forEach(([pid, payload]) => {
+          payload.checkedAt = now;
+          if (!htmlCache.has(Number(pid))) htmlCache.set(Number(pid), payload);
+        });
+        warmImages();
+      })
+      .catch(() => { /* ignore preload errors */ })
+      .finally(() => ids.forEach(pid => inflight.delete(pid)));
   }
 
   // Read current list-tile counts (to decide if cache is stale)
@@ -177,15 +225,25 @@
     if (a == null || b == null) return true;     // if either unknown, don't invalidate cache
     return Number(a) === Number(b);
   }
+  // Cached payloads younger than this are shown without asking the server
+  const REVALIDATE_AFTER_MS = 30000;
+
   async function getDetailEnsuringFreshness(id, url, { signal } = {}) {
     const tileCounts = readTileCounts(id);             // {comments, favorites} or nulls
     const cached = htmlCache.get(id);
     if (cached &&
+        Date.now() - (cached.checkedAt || 0) < REVALIDATE_AFTER_MS &&
         sameCount(cached.comments_count, tileCounts.comments) &&
         sameCount(cached.favorites_count, tileCounts.favorites)) {
       return cached;
     }
-    const fresh = await fetchDetailHTML(url, { signal }); // { html, comments_count, favorites_count, ... }
+    // Revalidate with the payload's ETag: unchanged is a bodiless 304
+    const fresh = await fetchDetailHTML(url, { signal, etag: cached?.etag });
+    if (fresh === null) {
+      cached.checkedAt = Date.now();
+      return cached;
+    }
+    fresh.checkedAt = Date.now();
     htmlCache.set(id, fresh);
     return fresh;
   }
@@ -250,7 +308,7 @@
 
     // Preload image
     const nextImg = incomingSwap.querySelector('img');
-    if (nextImg?.src) await preloadImage(nextImg.src);
+    if (nextImg?.src) await preloadImage(nextImg);
 
     // Keep height stable while fading
     oldSwap.style.minHeight = oldSwap.offsetHeight + 'px';
@@ -407,6 +465,34 @@
     }
   }
 
+  // A photo that isn't in the grid (e.g. from the similar panel): shown in
+  // the open modal; prev/next carry on from the grid position.
+  async function openOutsideGrid(id, url) {
+    const modalEl = document.getElementById(MODAL_ID);
+    if (!modalEl) return;
+
+    const seq = ++navSeq;
+    if (navAbort) navAbort.abort();
+    navAbort = new AbortController();
+    idToUrl.set(id, url);   // form posts go to the shown photo
+
+    try {
+      showLoadingWithDelay(modalEl, true);
+      const data = await getDetailEnsuringFreshness(id, url, { signal: navAbort.signal });
+      if (seq !== navSeq) return; // superseded
+
+      await swapModalContentSmooth(modalEl, data.html);
+      modalEl.setAttribute('data-photo-id', String(id));
+    } catch (err) {
+      if (err.name !== 'AbortError' && seq === navSeq) {
+        console.error(err);
+        toastInModal('Sorry, could not load that photo.');
+      }
+    } finally {
+      showLoadingWithDelay(modalEl, false);
+    }
+  }
+
   // =========================
   // Event wiring (delegated; wired once)
   // =========================
@@ -426,6 +512,15 @@
       if (next) {
         e.preventDefault();
         openByIndex((currentIndex + 1) % order.length);
+        return;
+      }
+      const similar = e.target.closest(SIMILAR_SELECTOR);
+      if (similar) {
+        e.preventDefault();
+        const id = Number(similar.dataset.photoId);
+        const idx = order.indexOf(id);
+        if (idx !== -1) openByIndex(idx);
+        else openOutsideGrid(id, similar.getAttribute('href'));
       }
     });
 
@@ -456,6 +551,7 @@
 
         // Update cache for this photo to prevent showing stale comments on quick reopen
         if (Number.isFinite(newId)) {
+          data.checkedAt = Date.now();
           htmlCache.set(newId, data);   // data should include { html, comments_count, favorites_count, ... }
         }
       } catch (err) {
@@ -474,6 +570,59 @@
     modalEl.addEventListener('hide.bs.modal',   () => document.removeEventListener('keydown', onKey));
   }
 
+  // =========================
+  // Infinite scroll (photo:grid_api)
+  // =========================
+  const grid = document.querySelector(GRID_SELECTOR);
+  const sentinel = document.querySelector(SENTINEL_SELECTOR);
+  let nextGridUrl = grid?.dataset.nextUrl || null;
+  let gridLoading = false;
+
+  // Append API tiles and extend the modal's prev/next order with them
+  function appendTiles(results) {
+    const tmp = document.createElement('div');
+    results.forEach(tile => {
+      if (idToUrl.has(tile.id)) return;   // already shown (rows shifted since the last page)
+      tmp.innerHTML = tile.html;
+      const el = tmp.firstElementChild;
+      if (!el) return;
+      grid.appendChild(el);
+      order.push(tile.id);
+      idToUrl.set(tile.id, tile.url);
+    });
+  }
+
+  function sentinelInView() {
+    return sentinel.getBoundingClientRect().top < window.innerHeight + 600;
+  }
+
+  async function loadMoreTiles() {
+    if (gridLoading || !nextGridUrl) return;
+    gridLoading = true;
+    try {
+      const data = await fetchJSON(nextGridUrl);   // ETag'd; the browser revalidates for us
+      appendTiles(data.results || []);
+      nextGridUrl = data.next || null;
+      document.querySelectorAll(PAGER_SELECTOR).forEach(el => el.classList.add('d-none'));
+    } catch (err) {
+      console.error(err);
+      nextGridUrl = null;   // leave the page links to it
+    } finally {
+      gridLoading = false;
+    }
+    if (!nextGridUrl) { gridObserver?.disconnect(); return; }
+    // Short pages on tall screens: the sentinel may still be showing
+    if (sentinelInView()) loadMoreTiles();
+  }
+
+  let gridObserver = null;
+  if (grid && sentinel && nextGridUrl && 'IntersectionObserver' in window) {
+    gridObserver = new IntersectionObserver(entries => {
+      if (entries.some(e => e.isIntersecting)) loadMoreTiles();
+    }, { rootMargin: '600px 0px' });
+    gridObserver.observe(sentinel);
+  }
+
   // =========================
   // Intercept thumbnail clicks
   // =========================
@@ -497,7 +646,7 @@
       return;
     }
 
-    // Not one of the current 24 (or mapping failed) → allow normal navigation
+    // Not a grid tile (or mapping failed) → allow normal navigation
   }, { capture: true });
 
   // =========================